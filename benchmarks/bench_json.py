@@ -0,0 +1,53 @@
+"""
+Замер сериализации и разбора JSON установленными кодеками на большом вложенном ответе
+
+    python -m benchmarks.bench_json
+"""
+import json
+import timeit
+
+from src.muscles.wsgi.wsgi.codec import available_codecs
+
+
+def make_payload(items):
+    return {
+        'items': [{
+            'id': i,
+            'name': 'user %s' % i,
+            'active': i % 2 == 0,
+            'score': i * 0.5,
+            'tags': ['a', 'b', 'c'],
+            'address': {'city': 'Moscow', 'street': 'Tverskaya', 'building': i},
+        } for i in range(items)],
+        'total': items,
+    }
+
+
+def legacy_dumps(payload):
+    def _recursive_dict_adapt(dictionary):
+        if isinstance(dictionary, dict):
+            return {key: _recursive_dict_adapt(value) for key, value in dictionary.items()}
+        elif isinstance(dictionary, list):
+            return [_recursive_dict_adapt(value) for value in dictionary]
+        return dictionary
+    return json.dumps(_recursive_dict_adapt(payload), default=str).encode('utf-8')
+
+
+def main(number=20):
+    print('%-8s %-8s %12s %12s' % ('items', 'codec', 'dumps ms', 'loads ms'))
+    for items in (1000, 10000, 100000):
+        payload = make_payload(items)
+        data = json.dumps(payload).encode('utf-8')
+        seconds = timeit.timeit(lambda: legacy_dumps(payload), number=number)
+        print('%-8s %-8s %12.2f %12s' % (items, 'legacy', seconds / number * 1e3, '-'))
+        for name, codec_class in available_codecs.items():
+            if codec_class is None:
+                continue
+            codec = codec_class()
+            dumps = timeit.timeit(lambda: codec.dumps(payload), number=number)
+            loads = timeit.timeit(lambda: codec.loads(data), number=number)
+            print('%-8s %-8s %12.2f %12.2f' % (items, name, dumps / number * 1e3, loads / number * 1e3))
+
+
+if __name__ == '__main__':
+    main()
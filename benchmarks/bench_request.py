@@ -0,0 +1,69 @@
+"""
+Замер создания запроса: прежний порядок (тело читается и распознается новым экземпляром libmagic при создании
+запроса) и ленивый разбор с определением MIME типа по началу тела
+
+    python -m benchmarks.bench_request
+"""
+import io
+import timeit
+
+import magic
+
+from src.muscles.wsgi.wsgi.request import RequestMaker
+
+ENVIRON = {
+    'REQUEST_METHOD': 'GET',
+    'REQUEST_URI': '/api/v1/test',
+    'PATH_INFO': '/api/v1/test',
+    'QUERY_STRING': '',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '8080',
+    'UWSGI_ROUTER': 'http',
+    'REMOTE_ADDR': '127.0.0.1',
+    'REMOTE_PORT': '34030',
+    'HTTP_HOST': 'localhost:8080',
+    'HTTP_ACCEPT_ENCODING': 'gzip, deflate, br',
+}
+
+
+def make_environ(body=b'', method='GET', content_type='application/octet-stream'):
+    environ = dict(ENVIRON, REQUEST_METHOD=method, CONTENT_LENGTH=str(len(body)))
+    environ['wsgi.input'] = io.BytesIO(body)
+    if body:
+        environ['CONTENT_TYPE'] = content_type
+    return environ
+
+
+def legacy(body, touch):
+    environ = make_environ(body, 'POST' if body else 'GET')
+    maker = RequestMaker(environ)
+    data = environ['wsgi.input'].read(len(body))
+    magic.Magic(mime=True).from_buffer(data)
+    environ['wsgi.input'].seek(0)
+    return maker.make()
+
+
+def current(body, touch):
+    request = RequestMaker(make_environ(body, 'POST' if body else 'GET')).make()
+    if touch:
+        request.raw
+    return request
+
+
+def main(number=2000):
+    png = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + b'\x00' * (64 * 1024)
+    cases = (
+        ('GET без тела', b'', False),
+        ('GET без тела, request.raw', b'', True),
+        ('POST 64 KiB, request.raw', png, True),
+    )
+    print('%-28s %14s %14s' % ('request', 'before req/s', 'after req/s'))
+    for name, body, touch in cases:
+        before = timeit.timeit(lambda: legacy(body, touch), number=number)
+        after = timeit.timeit(lambda: current(body, touch), number=number)
+        print('%-28s %14.0f %14.0f' % (name, number / before, number / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Замер сериализации тела ответа: количество вызовов make_body и время полной отправки ответа через транспорт
+
+    python -m benchmarks.bench_response
+"""
+import os
+import timeit
+from contextlib import redirect_stdout
+
+from src.muscles.wsgi.wsgi import Response, WsgiTransport
+
+
+class CountingResponse(Response):
+    calls = 0
+
+    def make_body(self):
+        CountingResponse.calls += 1
+        return super().make_body()
+
+
+def make_payload(items):
+    return [{'id': i, 'name': 'user %s' % i, 'tags': ['a', 'b', 'c'], 'score': i * 0.5} for i in range(items)]
+
+
+def send(transport, payload):
+    return transport.make_response(CountingResponse(200, payload))
+
+
+def main(number=200):
+    transport = WsgiTransport()
+    transport.environ = {'REQUEST_METHOD': 'GET'}
+    transport.start_response = lambda status, headers: None
+    print('%-8s %16s %14s' % ('items', 'make_body/req', 'us/request'))
+    for items in (10, 1000, 10000):
+        payload = make_payload(items)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            CountingResponse.calls = 0
+            send(transport, payload)
+            calls = CountingResponse.calls
+            seconds = timeit.timeit(lambda: send(transport, payload), number=number)
+        print('%-8s %16s %14.1f' % (items, calls, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Замер стоимости поиска статической директории на один запрос при 0, 10 и 100 подключенных директориях
+
+    python -m benchmarks.bench_static
+"""
+import timeit
+
+from src.muscles.wsgi.wsgi import Routes
+
+
+class BenchRequest:
+    def __init__(self, path):
+        self.path = path
+
+
+def make_router(mounts):
+    router = Routes(name='bench_static_%s' % mounts)
+    for i in range(mounts):
+        router.add_static('/tmp', prefix='/static%s' % i, full_path=True)
+    return router
+
+
+def main(number=200000):
+    paths = {
+        'api': BenchRequest('/api/v1/users/12/posts'),
+        'static hit': BenchRequest('/static0/css/app.css'),
+    }
+    print('%-8s %-12s %12s' % ('mounts', 'request', 'ns/request'))
+    for mounts in (0, 10, 100):
+        router = make_router(mounts)
+        for name, request in paths.items():
+            seconds = timeit.timeit(lambda: router.get_current_static(request), number=number)
+            print('%-8s %-12s %12.1f' % (mounts, name, seconds / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
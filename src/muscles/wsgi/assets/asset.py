@@ -25,7 +25,7 @@ class Asset:
 
     def __init__(self):
         path = os.path.dirname(os.path.abspath(muscles.core.__file__))
-        routes.add_static('/'.join([path, 'assets']), prefix='/mus', full_path=True)
+        routes.add_static('/'.join([path, 'assets']), prefix='/mus', full_path=True, file_cache=8 * 1024 * 1024)
 
     def add(self, tag=None, file=None, body=None, id=None, dependency=None):
         hash = hashlib.sha256()
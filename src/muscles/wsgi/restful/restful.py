@@ -2,8 +2,7 @@ import os.path
 import re
 
 from muscles.core import EventsStorageInterface, inject
-from muscles.core import Itinerary
-from ..wsgi import Routes
+from ..wsgi import Itinerary, Routes, conditional
 from ..template import Template
 from muscles.core import Schema
 from .swagger import Swagger
@@ -36,6 +35,7 @@ class RestApi(Itinerary):
         def _swagger(request):
             return template('templates/swagger.jinja2', swagger=self.swagger)
 
+        @conditional(version=lambda request: (Itinerary._generation, request.path))
         def _schema(request):
             swagger = Swagger.load(request.path)
             return swagger.dump()
@@ -46,7 +46,7 @@ class RestApi(Itinerary):
 
     def _trigger_set_handler(self, handler, *args, tags: list = None, description: str = None, summary: str = None,
                              request: list = [], security: list = [], response: dict = {}, parameters: list = [],
-                             **kwargs):
+                             cache=None, **kwargs):
         if not hasattr(handler, 'description') or not handler.description:
             handler.description = description
         if not hasattr(handler, 'summary') or not handler.summary:
@@ -61,7 +61,8 @@ class RestApi(Itinerary):
             handler.parameters = parameters
         else:
             handler.parameters = handler.parameters + parameters
-
+        if cache is not None:
+            handler.cache = cache
         return handler
 
     def _trigger_set_controller(self, handler, *args, tags: list = None, description: str = None, summary: str = None,
@@ -1,9 +1,16 @@
 from .strategy import WsgiStrategy
 from .request import ImproperBodyPartContentException, NonMultipartContentTypeException, BodyPart, FileStorage, \
     FieldStorage, Request
-from .response import MakeResponse, BaseResponse, Response, BadResponse
+from .multipart import MultipartParser
+from .response import MakeResponse, BaseResponse, CachedFileResponse, CachedResponse, StreamingResponse, \
+    JsonStreamResponse, EventSourceResponse, Response, BadResponse
 from .error_handler import ResponseErrorHandler
 from .http_code import code_status
+from .codec import JsonCodec, set_codec, get_codec
+from .compression import Compression
+from .conditional import conditional
+from .response_cache import Cache
+from .cache_backends import CacheBackend, UwsgiCacheBackend, FileCacheBackend, shared_backend
 from .server import Transport, WsgiTransport, WsgiServer
 from .routers import RouteRule, RouteRuleDefault, RouteRuleVar, RouteRuleInt, RouteRuleFloat, Itinerary, Node, Routes, \
     Api, api, routes, itinerary
@@ -18,11 +25,27 @@ __all__ = (
     "FileStorage",
     "FieldStorage",
     "Request",
+    "MultipartParser",
     "Response",
     "BadResponse",
     "BaseResponse",
+    "CachedFileResponse",
+    "CachedResponse",
+    "StreamingResponse",
+    "JsonStreamResponse",
+    "EventSourceResponse",
     "MakeResponse",
     "code_status",
+    "JsonCodec",
+    "set_codec",
+    "get_codec",
+    "Compression",
+    "conditional",
+    "Cache",
+    "CacheBackend",
+    "UwsgiCacheBackend",
+    "FileCacheBackend",
+    "shared_backend",
     "Transport",
     "WsgiTransport",
     "WsgiServer",
@@ -0,0 +1,271 @@
+import os
+import stat as stat_module
+import mimetypes
+import threading
+from collections import OrderedDict
+
+from .files import file_etag, http_date
+
+#: Максимальный размер одного файла в кэше файлов
+FILE_CACHE_MAX_FILE_SIZE = 1024 * 1024
+
+
+class LRUCache:
+    """
+    Кэш ограниченного размера с вытеснением давно неиспользуемых записей
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        Конструктор кэша
+
+        :param maxsize: Максимальное количество записей
+        """
+        if maxsize <= 0:
+            raise Exception('Cache `maxsize` must be greater than zero')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Возвращает значение записи и помечает ее как последнюю использованную
+
+        :param key: Ключ записи
+        :param default: Значение, если запись не найдена
+        :return:
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Сохраняет запись, при переполнении вытесняет самую давнюю
+
+        :param key: Ключ записи
+        :param value: Значение записи
+        :return:
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """
+        Удаляет запись
+
+        :param key: Ключ записи
+        :param default: Значение, если запись не найдена
+        :return:
+        """
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def pop_matching(self, predicate) -> int:
+        """
+        Удаляет записи, ключи которых удовлетворяют условию
+
+        :param predicate: Функция ключ => bool
+        :return: Количество удаленных записей
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        """
+        Очищает кэш, счетчики сохраняются
+
+        :return:
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """
+        Статистика кэша
+
+        :return: dict
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CachedFile:
+    """
+    Файл в памяти с заранее вычисленными заголовками
+    """
+
+    __slots__ = ('path', 'stat', 'data', 'etag', 'last_modified', 'headers')
+
+    def __init__(self, path: str, stat, data: bytes):
+        """
+        Конструктор записи
+
+        :param path: Путь к файлу
+        :param stat: Результат os.stat файла
+        :param data: Содержимое файла
+        """
+        self.path = path
+        self.stat = stat
+        self.data = data
+        self.etag = file_etag(stat)
+        self.last_modified = http_date(stat.st_mtime)
+        content_type, encoding = mimetypes.guess_type(path)
+        self.headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Content-Length', str(len(data))),
+        ]
+        if encoding is not None:
+            self.headers.append(('Content-Encoding', encoding))
+
+    def is_fresh(self, stat) -> bool:
+        """
+        Проверяет, что файл на диске не изменился
+
+        :param stat: Текущий результат os.stat файла
+        :return: bool
+        """
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino) == \
+            (self.stat.st_mtime_ns, self.stat.st_size, self.stat.st_ino)
+
+
+class FileCache:
+    """
+    Кэш содержимого файлов, ограниченный суммарным размером в байтах, с вытеснением давно неиспользуемых файлов.
+    Запись сбрасывается, если у файла изменились время изменения, размер или inode
+    """
+
+    def __init__(self, max_bytes: int, max_file_size: int = None):
+        """
+        Конструктор кэша
+
+        :param max_bytes: Максимальный суммарный размер файлов в байтах
+        :param max_file_size: Максимальный размер одного файла, большие файлы читаются с диска
+        """
+        if max_bytes <= 0:
+            raise Exception('Cache `max_bytes` must be greater than zero')
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_bytes, max_file_size or FILE_CACHE_MAX_FILE_SIZE)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str):
+        """
+        Возвращает файл из кэша, при промахе читает его с диска
+
+        :param path: Путь к файлу
+        :return: CachedFile или None, если файл не найден или слишком большой
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.pop(path)
+            return None
+        with self._lock:
+            entry = self._data.get(path)
+            if entry is not None and entry.is_fresh(stat):
+                self._data.move_to_end(path)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(path)
+                self.invalidations += 1
+            self.misses += 1
+        if not stat_module.S_ISREG(stat.st_mode) or stat.st_size > self.max_file_size:
+            return None
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        except OSError:
+            return None
+        if len(data) != stat.st_size:
+            return None
+        entry = CachedFile(path, stat, data)
+        with self._lock:
+            self._remove(path)
+            self._data[path] = entry
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                key, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted.data)
+                self.evictions += 1
+        return entry
+
+    def _remove(self, path):
+        entry = self._data.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry.data)
+
+    def pop(self, path: str):
+        """
+        Удаляет файл из кэша
+
+        :param path: Путь к файлу
+        :return:
+        """
+        with self._lock:
+            self._remove(path)
+
+    def clear(self):
+        """
+        Очищает кэш, счетчики сохраняются
+
+        :return:
+        """
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """
+        Статистика кэша
+
+        :return: dict
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'files': len(self._data),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+        }
+
+    def __contains__(self, path):
+        return path in self._data
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,321 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from stat import S_ISDIR
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+_EXPIRES = struct.Struct('!d')
+
+
+class CacheBackend(ABC):
+    """
+    Общее хранилище кэша для всех воркеров узла. Хранит байты с временем жизни, ключи - строки
+    """
+
+    #: Значения хранятся вне процесса и передаются байтами
+    shared = True
+
+    def __init__(self, max_item_size: int = 1024 * 1024):
+        """
+        Конструктор хранилища
+
+        :param max_item_size: Максимальный размер значения в байтах, большие значения не сохраняются
+        """
+        self.max_item_size = max_item_size
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.rejected = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str):
+        """
+        Возвращает значение
+
+        :param key: Ключ
+        :return: bytes или None
+        """
+        value = self.peek(key)
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    @abstractmethod
+    def peek(self, key: str):
+        """
+        Возвращает значение без учета в статистике попаданий, для служебных ключей
+
+        :param key: Ключ
+        :return: bytes или None
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float):
+        """
+        Сохраняет значение
+
+        :param key: Ключ
+        :param value: Значение
+        :param ttl: Время жизни в секундах
+        :return: bool - значение сохранено
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Удаляет значение
+
+        :param key: Ключ
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """
+        Удаляет все значения
+
+        :return:
+        """
+        pass
+
+    def stats(self) -> dict:
+        """
+        Статистика хранилища в текущем воркере
+
+        :return: dict
+        """
+        return {
+            'backend': self.__class__.__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'sets': self.sets,
+            'rejected': self.rejected,
+            'evictions': self.evictions,
+        }
+
+
+class UwsgiCacheBackend(CacheBackend):
+    """
+    Хранилище в кэше uWSGI. Кэш объявляется в конфигурации uWSGI, там же задаются его размеры:
+
+        cache2 = name=responses,items=2000,blocksize=65536,purge_lru=1
+    """
+
+    def __init__(self, name: str = 'responses', max_item_size: int = 64 * 1024):
+        """
+        Конструктор хранилища
+
+        :param name: Имя кэша uWSGI
+        :param max_item_size: Максимальный размер значения, не больше blocksize кэша uWSGI
+        """
+        if uwsgi is None:
+            raise Exception('uWSGI cache is available only under uWSGI')
+        super().__init__(max_item_size=max_item_size)
+        self.name = name
+
+    def peek(self, key: str):
+        return uwsgi.cache_get(key, self.name)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_item_size:
+            self._count('rejected')
+            return False
+        if not uwsgi.cache_update(key, value, max(int(ttl), 1), self.name):
+            self._count('rejected')
+            return False
+        self._count('sets')
+        return True
+
+    def delete(self, key: str):
+        uwsgi.cache_del(key, self.name)
+
+    def clear(self):
+        uwsgi.cache_clear(self.name)
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    Хранилище в файлах общей директории, по умолчанию в /dev/shm (память). Используется вне uWSGI.
+    Директория доступна только текущему пользователю. При превышении размера удаляются самые давно
+    записанные значения
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 64 * 1024 * 1024, max_item_size: int = 1024 * 1024,
+                 scan_interval: float = 60):
+        """
+        Конструктор хранилища
+
+        :param directory: Директория хранилища
+        :param max_bytes: Максимальный суммарный размер значений в байтах
+        :param max_item_size: Максимальный размер значения в байтах
+        :param scan_interval: Период в секундах, с которым размер директории пересчитывается с учетом записей
+            других воркеров
+        """
+        super().__init__(max_item_size=min(max_item_size, max_bytes))
+        if directory is None:
+            directory = default_directory()
+        self.directory = secure_directory(directory)
+        self.max_bytes = max_bytes
+        self.scan_interval = scan_interval
+        #: Размер директории по последнему обходу и записям этого воркера после него, None - обхода не было
+        self._size = None
+        self._scanned = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest())
+
+    def peek(self, key: str):
+        try:
+            with open(self._path(key), 'rb') as fp:
+                data = fp.read()
+        except OSError:
+            return None
+        if len(data) < _EXPIRES.size or _EXPIRES.unpack_from(data)[0] < time.time():
+            return None
+        return data[_EXPIRES.size:]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_item_size:
+            self._count('rejected')
+            return False
+        path = self._path(key)
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(_EXPIRES.pack(time.time() + ttl))
+                fp.write(value)
+            os.replace(temp, path)
+        except OSError:
+            self._count('rejected')
+            try:
+                os.unlink(temp)
+            except OSError:
+                pass
+            return False
+        self._count('sets')
+        with self._lock:
+            if self._size is not None:
+                self._size += _EXPIRES.size + len(value)
+            scan = self._size is None or self._size > self.max_bytes or \
+                time.monotonic() - self._scanned > self.scan_interval
+        if scan:
+            self._evict()
+        return True
+
+    def _evict(self):
+        """
+        Пересчитывает размер директории и, если он больше max_bytes, удаляет самые старые значения до 90%
+        max_bytes, чтобы следующие записи не вызывали обход директории. Вызывается при превышении размера
+        по счетчику воркера и раз в scan_interval, поэтому запись обходится без просмотра всей директории
+
+        :return:
+        """
+        entries = []
+        size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            size += stat.st_size
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        if size > self.max_bytes:
+            limit = self.max_bytes - self.max_bytes // 10
+            for mtime, file_size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                self._count('evictions')
+                size -= file_size
+                if size <= limit:
+                    break
+        with self._lock:
+            self._size = size
+            self._scanned = time.monotonic()
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+def default_directory(name: str = None) -> str:
+    """
+    Возвращает директорию файлового хранилища по умолчанию: /dev/shm/muscles-cache-<uid>[/name]
+
+    :param name: Имя поддиректории
+    :return: str
+    """
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    directory = os.path.join(base, 'muscles-cache-%d' % os.getuid() if hasattr(os, 'getuid') else 'muscles-cache')
+    if name is not None:
+        directory = os.path.join(secure_directory(directory), name)
+    return directory
+
+
+def secure_directory(directory: str) -> str:
+    """
+    Создает директорию с правами 0700 или проверяет существующую: она не должна быть ссылкой, должна
+    принадлежать текущему пользователю и не должна быть доступна на запись другим. Иначе другой пользователь
+    узла мог бы подложить значения в кэш
+
+    :param directory: Директория
+    :return: str
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    stat = os.lstat(directory)
+    if not S_ISDIR(stat.st_mode):
+        raise Exception('Cache directory `%s` is not a directory' % directory)
+    if hasattr(os, 'getuid') and stat.st_uid != os.getuid():
+        raise Exception('Cache directory `%s` is not owned by the current user' % directory)
+    if stat.st_mode & 0o022:
+        raise Exception('Cache directory `%s` is writable by other users' % directory)
+    return directory
+
+
+def shared_backend(name: str = 'responses', **kwargs) -> CacheBackend:
+    """
+    Возвращает общее хранилище: кэш uWSGI под uWSGI, иначе файловое хранилище
+
+    :param name: Имя кэша uWSGI или поддиректории файлового хранилища
+    :param kwargs: Настройки файлового хранилища
+    :return: CacheBackend
+    """
+    if uwsgi is not None and hasattr(uwsgi, 'cache_get'):
+        return UwsgiCacheBackend(name=name)
+    if kwargs.get('directory') is None:
+        kwargs['directory'] = default_directory(name)
+    return FileCacheBackend(**kwargs)
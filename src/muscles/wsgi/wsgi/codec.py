@@ -0,0 +1,162 @@
+import json
+from json import JSONEncoder
+
+from muscles.core import BaseModel, Collection
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def default(obj):
+    """
+    Преобразует объекты, которые кодек не умеет сериализовать. Модели и коллекции сериализуются по месту,
+    без предварительного копирования всего дерева
+
+    :param obj: Объект
+    :return:
+    """
+    if isinstance(obj, BaseModel) or isinstance(obj, Collection):
+        return obj.to_json()
+    return str(obj)
+
+
+class ObjectJSONEncoder(JSONEncoder):
+    def default(self, obj):
+        return default(obj)
+
+
+class JsonCodec:
+    """
+    Кодек JSON стандартной библиотеки
+    """
+
+    name = 'json'
+
+    def dumps(self, obj) -> bytes:
+        """
+        Сериализует объект в байты UTF-8
+
+        :param obj: Объект
+        :return: bytes
+        """
+        return json.dumps(obj, cls=ObjectJSONEncoder).encode('utf-8')
+
+    def loads(self, data, charset: str = 'utf-8'):
+        """
+        Разбирает JSON
+
+        :param data: bytes или str
+        :param charset: Кодировка байт
+        :return:
+        """
+        if isinstance(data, bytes):
+            data = data.decode(charset)
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    Кодек orjson, сериализует сразу в байты. Дата, время и dataclass передаются в default, как в стандартном кодеке
+    """
+
+    name = 'orjson'
+    option = 0
+
+    def __init__(self):
+        self.option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(self, obj) -> bytes:
+        try:
+            return orjson.dumps(obj, default=default, option=self.option)
+        except TypeError:
+            # Целые больше 64 бит и прочие ограничения orjson
+            return super().dumps(obj)
+
+    def loads(self, data, charset: str = 'utf-8'):
+        if isinstance(data, bytes) and charset.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            data = data.decode(charset)
+        return orjson.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    """
+    Кодек ujson
+    """
+
+    name = 'ujson'
+
+    def dumps(self, obj) -> bytes:
+        try:
+            return ujson.dumps(obj, default=default, escape_forward_slashes=False).encode('utf-8')
+        except (TypeError, OverflowError):
+            return super().dumps(obj)
+
+    def loads(self, data, charset: str = 'utf-8'):
+        if isinstance(data, bytes):
+            data = data.decode(charset)
+        return ujson.loads(data)
+
+
+available_codecs = {
+    'orjson': OrjsonCodec if orjson is not None else None,
+    'ujson': UjsonCodec if ujson is not None else None,
+    'json': JsonCodec,
+}
+codec: JsonCodec = None
+
+
+def set_codec(name: str = 'json') -> JsonCodec:
+    """
+    Выбирает кодек JSON для запросов и ответов. По умолчанию стандартный json, orjson и ujson подключаются явно:
+    они формируют компактный JSON без пробелов после разделителей, поэтому тело ответа отличается побайтно
+
+    :param name: orjson, ujson или json
+    :return: JsonCodec
+    """
+    global codec
+    if name not in available_codecs:
+        raise Exception('JSON codec `%s` is not supported' % name)
+    if available_codecs[name] is None:
+        raise Exception('JSON codec `%s` is not installed' % name)
+    codec = available_codecs[name]()
+    return codec
+
+
+def get_codec() -> JsonCodec:
+    """
+    Возвращает текущий кодек JSON
+
+    :return: JsonCodec
+    """
+    return codec
+
+
+def dumps(obj) -> bytes:
+    """
+    Сериализует объект текущим кодеком
+
+    :param obj: Объект
+    :return: bytes
+    """
+    return codec.dumps(obj)
+
+
+def loads(data, charset: str = 'utf-8'):
+    """
+    Разбирает JSON текущим кодеком
+
+    :param data: bytes или str
+    :param charset: Кодировка байт
+    :return:
+    """
+    return codec.loads(data, charset=charset)
+
+
+set_codec()
@@ -0,0 +1,194 @@
+import zlib
+
+from .files import negotiate_encoding
+from .streaming import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#: Типы контента, которые сжимаются по умолчанию
+COMPRESSIBLE_TYPES = (
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/csv',
+    'text/xml',
+    'text/javascript',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/x-ndjson',
+    'image/svg+xml',
+)
+#: Статусы, тело которых сжимается
+COMPRESSIBLE_STATUSES = ('200', '201', '202', '203', '400', '401', '403', '404', '409', '422', '500')
+
+
+class Compression:
+    """
+    Сжатие ответов на лету (gzip, brotli) по заголовку Accept-Encoding.
+    Ответы файлами не сжимаются: статические файлы отдаются как есть или заранее сжатыми (precompressed)
+    """
+
+    def __init__(self, min_size: int = 1024, level: int = 6, brotli_quality: int = 4,
+                 content_types=COMPRESSIBLE_TYPES, encodings=('br', 'gzip')):
+        """
+        Конструктор сжатия
+
+        :param min_size: Минимальный размер тела ответа в байтах, меньшие ответы не сжимаются
+        :param level: Уровень сжатия gzip 1-9
+        :param brotli_quality: Уровень сжатия brotli 0-11
+        :param content_types: Типы контента, которые сжимаются
+        :param encodings: Кодировки в порядке предпочтения, brotli используется, если установлен
+        """
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.content_types = tuple(content_types)
+        self.encodings = tuple(encoding for encoding in encodings if encoding != 'br' or brotli is not None)
+
+    @staticmethod
+    def _header(headers, name):
+        name = name.lower()
+        return next((value for key, value in headers if key.lower() == name), None)
+
+    def is_compressible(self, status, headers) -> bool:
+        """
+        Проверяет, что ответ можно сжимать: статус, тип контента, ответ еще не сжат
+
+        :param status: HTTP Код статуса ответа
+        :param headers: Заголовки ответа
+        :return: bool
+        """
+        if str(status) not in COMPRESSIBLE_STATUSES or self._header(headers, 'Content-Encoding'):
+            return False
+        content_type = (self._header(headers, 'Content-Type') or '').split(';')[0].strip().lower()
+        return content_type in self.content_types
+
+    def negotiate(self, accept_encoding) -> [str, None]:
+        """
+        Выбирает кодировку по заголовку Accept-Encoding
+
+        :param accept_encoding: Значение заголовка Accept-Encoding
+        :return: str или None
+        """
+        return negotiate_encoding(accept_encoding, self.encodings)
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """
+        Сжимает тело ответа целиком
+
+        :param data: Тело ответа
+        :param encoding: br или gzip
+        :return: bytes
+        """
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_stream(self, chunks, encoding: str):
+        """
+        Сжимает потоковое тело по частям. Каждая часть сбрасывается (flush), чтобы клиент получал данные
+        по мере их появления
+
+        :param chunks: Итерируемый объект частей ответа
+        :param encoding: br или gzip
+        :return: генератор bytes
+        """
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            for chunk in chunks:
+                data = compressor.process(chunk) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            for chunk in chunks:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+
+    @staticmethod
+    def _headers(headers, encoding, length=None):
+        result = []
+        vary = None
+        for name, value in headers:
+            lower = name.lower()
+            if lower == 'content-length':
+                continue
+            if lower == 'vary':
+                vary = value
+                continue
+            if lower == 'etag' and encoding is not None and not value.startswith('W/'):
+                value = 'W/' + value
+            result.append((name, value))
+        if vary is None:
+            vary = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+            vary = vary + ', Accept-Encoding'
+        result.append(('Vary', vary))
+        if encoding is not None:
+            result.append(('Content-Encoding', encoding))
+        if length is not None:
+            result.append(('Content-Length', str(length)))
+        return result
+
+    def apply(self, environ, status, headers, body):
+        """
+        Сжимает готовое тело ответа
+
+        :param environ: Переменные запроса
+        :param status: HTTP Код статуса ответа
+        :param headers: Заголовки ответа
+        :param body: Тело ответа
+        :return: (заголовки, тело)
+        """
+        if not isinstance(body, bytes) or not self.is_compressible(status, headers):
+            return headers, body
+        encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or len(body) < self.min_size:
+            return self._headers(headers, None, len(body)), body
+        body = self.compress(body, encoding)
+        return self._headers(headers, encoding, len(body)), body
+
+    def not_modified_headers(self, environ, status, headers, body):
+        """
+        Заголовки ответа 304 для тела, которое было бы отправлено с кодом 200: ETag ослабляется и Vary
+        добавляется так же, как в apply, но тело не сжимается
+
+        :param environ: Переменные запроса
+        :param status: HTTP Код статуса ответа, который был бы отправлен
+        :param headers: Заголовки ответа
+        :param body: Тело ответа
+        :return: Заголовки без Content-Length, Content-Type и Content-Encoding
+        """
+        if isinstance(body, bytes) and self.is_compressible(status, headers):
+            encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+            if encoding is not None and len(body) < self.min_size:
+                encoding = None
+            headers = self._headers(headers, encoding)
+        return [header for header in headers
+                if header[0].lower() not in ('content-length', 'content-type', 'content-encoding')]
+
+    def apply_stream(self, environ, status, headers, body):
+        """
+        Сжимает потоковое тело ответа. Обработчики закрытия исходного потока сохраняются
+
+        :param environ: Переменные запроса
+        :param status: HTTP Код статуса ответа
+        :param headers: Заголовки ответа
+        :param body: ClosingIterator потокового ответа
+        :return: (заголовки, тело)
+        """
+        if not self.is_compressible(status, headers):
+            return headers, body
+        encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return self._headers(headers, None), body
+        return self._headers(headers, encoding), ClosingIterator(self.compress_stream(body, encoding),
+                                                                 callbacks=[body.close])
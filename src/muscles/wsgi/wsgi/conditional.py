@@ -0,0 +1,49 @@
+import hashlib
+
+
+def body_etag(body: bytes) -> str:
+    """
+    Формирует ETag по готовому телу ответа
+
+    :param body: Тело ответа
+    :return: str
+    """
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def version_etag(token) -> [str, None]:
+    """
+    Формирует ETag по токену версии ресурса
+
+    :param token: Токен версии: строка, число или кортеж, None - версия неизвестна
+    :return: str или None
+    """
+    if token is None:
+        return None
+    if not isinstance(token, bytes):
+        token = repr(token).encode('utf-8')
+    return '"v-%s"' % hashlib.blake2b(token, digest_size=16).hexdigest()
+
+
+def conditional(version=None, auto_etag: bool = True):
+    """
+    Декоратор условных ответов обработчика. Указывается под декоратором маршрута:
+
+        @router.init('/users/{id}', method='GET')
+        @conditional(version=lambda request, id=None: users.updated_at(id))
+        def user(request, id=None):
+            ...
+
+    Если задана функция версии, она вызывается до обработчика. Если ETag версии совпадает с If-None-Match,
+    отдается 304 без вызова обработчика. Иначе ETag считается по готовому телу ответа
+
+    :param version: Функция (request, **параметры маршрута) => токен версии ресурса или None
+    :param auto_etag: Формировать ETag по телу ответа
+    :return:
+    """
+    def decorator(func):
+        func.version = version
+        func.auto_etag = auto_etag
+        return func
+
+    return decorator
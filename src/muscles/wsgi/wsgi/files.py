@@ -0,0 +1,282 @@
+from email.utils import formatdate, parsedate_to_datetime
+
+FILE_CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 32
+#: Предварительно сжатые файлы рядом с исходным в порядке предпочтения: (Content-Encoding, расширение)
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class FileIterator:
+    """
+    Итератор файла ответа. Читает файл блоками ограниченного размера, поэтому память на запрос не зависит от
+    размера файла
+    """
+
+    def __init__(self, fp, length=None, chunk_size: int = FILE_CHUNK_SIZE):
+        """
+        Конструктор итератора
+
+        :param fp: Открытый файл
+        :param length: Количество байт для чтения с текущей позиции, None - до конца файла
+        :param chunk_size: Размер блока
+        """
+        self.fp = fp
+        self.remaining = length
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        size = self.chunk_size if self.remaining is None else min(self.chunk_size, self.remaining)
+        if size <= 0:
+            raise StopIteration
+        data = self.fp.read(size)
+        if not data:
+            raise StopIteration
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return data
+
+    def close(self):
+        """
+        Закрывает файл, вызывается WSGI сервером после отправки ответа
+
+        :return:
+        """
+        self.fp.close()
+
+
+def file_etag(stat, weak: bool = False) -> str:
+    """
+    Формирует ETag файла из inode, размера и времени изменения
+
+    :param stat: Результат os.stat файла
+    :param weak: Слабый валидатор
+    :return: str
+    """
+    etag = '"%x-%x-%x"' % (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    return 'W/' + etag if weak else etag
+
+
+def http_date(timestamp) -> str:
+    """
+    Формирует дату в формате HTTP
+
+    :param timestamp: Время в секундах
+    :return: str
+    """
+    return formatdate(timestamp, usegmt=True)
+
+
+def cache_control(max_age: int = None, immutable: bool = False, public: bool = True):
+    """
+    Формирует значение заголовка Cache-Control
+
+    :param max_age: Время жизни в секундах
+    :param immutable: Файл никогда не меняется по этому адресу
+    :param public: Разрешено кэширование на промежуточных серверах
+    :return: str или None, если политика не задана
+    """
+    if max_age is None and not immutable:
+        return None
+    directives = ['public' if public else 'private']
+    if max_age is not None:
+        directives.append('max-age=%d' % max_age)
+    if immutable:
+        directives.append('immutable')
+    return ', '.join(directives)
+
+
+def _strip_weak(etag):
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def is_not_modified(headers: dict, etag: str = None, mtime=None) -> bool:
+    """
+    Проверяет условия If-None-Match и If-Modified-Since запроса. If-Modified-Since учитывается только при
+    отсутствии If-None-Match
+
+    :param headers: Заголовки запроса
+    :param etag: ETag ресурса
+    :param mtime: Время изменения ресурса в секундах
+    :return: bool
+    """
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        if etag is None:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        etag = _strip_weak(etag)
+        return any(_strip_weak(tag) == etag for tag in if_none_match.split(','))
+
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since and mtime is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError, IndexError):
+            return False
+        if since is None:
+            return False
+        return int(mtime) <= since.timestamp()
+    return False
+
+
+def parse_range(header: str, size: int):
+    """
+    Разбирает заголовок Range: bytes=0-499,500-999,-500,9500-
+
+    :param header: Значение заголовка Range
+    :param size: Размер файла
+    :return: None - заголовок не поддерживается и отдается весь файл, [] - диапазоны не выполнимы (416),
+             список диапазонов (начало, конец) включительно
+    """
+    if not header:
+        return None
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not ranges:
+        return None
+    specs = ranges.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    result = []
+    for spec in specs:
+        start, sep, end = spec.strip().partition('-')
+        start, end = start.strip(), end.strip()
+        if not sep or (start and not start.isdigit()) or (end and not end.isdigit()) or (not start and not end):
+            return None
+        if not start:
+            length = int(end)
+            if length == 0:
+                continue
+            result.append((max(size - length, 0), size - 1))
+            continue
+        start = int(start)
+        if end:
+            end = int(end)
+            if end < start:
+                return None
+        else:
+            end = size - 1
+        if start >= size:
+            continue
+        result.append((start, min(end, size - 1)))
+    return result
+
+
+def if_range_matches(if_range: str, etag: str = None, mtime=None) -> bool:
+    """
+    Проверяет условие If-Range. ETag сравнивается строго, дата - на точное совпадение с Last-Modified
+
+    :param if_range: Значение заголовка If-Range
+    :param etag: ETag ресурса
+    :param mtime: Время изменения ресурса в секундах
+    :return: bool
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return etag is not None and not if_range.startswith('W/') and not etag.startswith('W/') and if_range == etag
+    return mtime is not None and if_range == http_date(mtime)
+
+
+class MultipartRangeIterator:
+    """
+    Итератор ответа multipart/byteranges. Каждый диапазон читается с диска блоками
+    """
+
+    def __init__(self, fp, ranges, size: int, content_type: str, boundary: str,
+                 chunk_size: int = FILE_CHUNK_SIZE):
+        """
+        Конструктор итератора
+
+        :param fp: Открытый файл
+        :param ranges: Список диапазонов (начало, конец)
+        :param size: Размер файла
+        :param content_type: Тип файла
+        :param boundary: Разделитель частей
+        :param chunk_size: Размер блока
+        """
+        self.fp = fp
+        self.ranges = ranges
+        self.size = size
+        self.content_type = content_type
+        self.boundary = boundary
+        self.chunk_size = chunk_size
+
+    def part_header(self, start: int, end: int) -> bytes:
+        return ('--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+            self.boundary, self.content_type, start, end, self.size)).encode('latin-1')
+
+    def closing(self) -> bytes:
+        return ('--%s--\r\n' % self.boundary).encode('latin-1')
+
+    @property
+    def content_length(self) -> int:
+        """
+        Размер тела ответа
+        :return: int
+        """
+        length = len(self.closing())
+        for start, end in self.ranges:
+            length += len(self.part_header(start, end)) + end - start + 1 + 2
+        return length
+
+    def __iter__(self):
+        for start, end in self.ranges:
+            yield self.part_header(start, end)
+            self.fp.seek(start)
+            yield from FileIterator(self.fp, end - start + 1, self.chunk_size)
+            yield b'\r\n'
+        yield self.closing()
+
+    def close(self):
+        self.fp.close()
+
+
+def accepted_encodings(header: str) -> dict:
+    """
+    Разбирает заголовок Accept-Encoding: gzip, br;q=0.9, *;q=0
+
+    :param header: Значение заголовка Accept-Encoding
+    :return: dict кодировка => q
+    """
+    result = {}
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        result[name] = q
+    return result
+
+
+def negotiate_encoding(header: str, available) -> [str, None]:
+    """
+    Выбирает кодировку из доступных по заголовку Accept-Encoding. При равном q выигрывает кодировка,
+    стоящая раньше в списке доступных
+
+    :param header: Значение заголовка Accept-Encoding
+    :param available: Доступные кодировки в порядке предпочтения
+    :return: str или None
+    """
+    if not header or not available:
+        return None
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get('*', 0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
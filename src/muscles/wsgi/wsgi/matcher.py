@@ -0,0 +1,155 @@
+class MatcherNode:
+    """
+    Скомпилированный узел дерева маршрутов
+    """
+
+    __slots__ = ('node', 'keyed', 'static', 'dynamic')
+
+    def __init__(self, node, keys):
+        """
+        Конструктор скомпилированного узла
+
+        :param node: Узел роутера
+        :param keys: Ключи зарегистрированных маршрутов
+        """
+        self.node = node
+        self.keyed = node.key in keys
+        #: Статические потомки: часть пути => (позиция, узел)
+        self.static = {}
+        #: Потомки с правилами: (позиция, проверка, узел)
+        self.dynamic = []
+
+    def candidates(self, chunk):
+        """
+        Возвращает подходящих потомков в порядке потомков узла
+
+        :param chunk: Часть пути
+        :return: list
+        """
+        static = self.static.get(chunk)
+        if not self.dynamic:
+            return (static[1],) if static is not None else ()
+        result = []
+        for position, check, child in self.dynamic:
+            if static is not None and static[0] < position:
+                result.append(static[1])
+                static = None
+            if check(chunk):
+                result.append(child)
+        if static is not None:
+            result.append(static[1])
+        return result
+
+
+class RouteMatcher:
+    """
+    Скомпилированное дерево маршрутов.
+
+    Статические части пути хранятся в словаре, части с правилами проверяются предкомпилированными проверками.
+    Порядок обхода совпадает с порядком потомков узла (статические части раньше частей с правилами),
+    поэтому результат такой же, как у полного обхода дерева.
+    """
+
+    def __init__(self, root, keys, is_static=None):
+        """
+        Конструктор дерева
+
+        :param root: Корневой узел роутера
+        :param keys: Ключи зарегистрированных маршрутов
+        :param is_static: Функция, определяющая статическое правило узла
+        """
+        self._keys = frozenset(keys)
+        self._is_static = is_static or (lambda rule: False)
+        self.root = self._compile(root)
+
+    def _compile(self, node):
+        entry = MatcherNode(node, self._keys)
+        for position, child in enumerate(node.childrens):
+            compiled = self._compile(child)
+            if self._is_static(child.rule):
+                entry.static.setdefault(child.route, (position, compiled))
+            else:
+                entry.dynamic.append((position, self._check(child), compiled))
+        return entry
+
+    @staticmethod
+    def _check(node):
+        rule = node.rule
+        if hasattr(rule, 'matcher'):
+            return rule.matcher(node.route)
+        return lambda chunk: rule.is_match(chunk, node.route)
+
+    def match(self, chunks):
+        """
+        Находит узел маршрута по частям пути
+
+        :param chunks: Непустые части пути
+        :return: Node или None
+        """
+        if not chunks:
+            return None
+        entry = self._walk(self.root, chunks, 0, len(chunks) - 1)
+        return entry.node if entry is not None else None
+
+    def _walk(self, entry, chunks, depth, last):
+        for child in entry.candidates(chunks[depth]):
+            if depth == last:
+                if child.keyed:
+                    return child
+            else:
+                found = self._walk(child, chunks, depth + 1, last)
+                if found is not None:
+                    return found
+        return None
+
+
+class RouterIndex:
+    """
+    Общий индекс роутеров по первой части пути.
+
+    Для каждой статической первой части пути хранит роутеры, которые могут обработать запрос, в порядке их
+    создания. Роутеры с переменной первой частью пути или без скомпилированного дерева проверяются всегда.
+    """
+
+    def __init__(self, instances, segments):
+        """
+        Конструктор индекса
+
+        :param instances: Роутеры в порядке создания
+        :param segments: Функция, возвращающая множество первых частей пути роутера или None для любых путей
+        """
+        wildcard = []
+        owners = {}
+        for position, instance in enumerate(instances):
+            _segments = segments(instance)
+            if _segments is None:
+                wildcard.append(position)
+                continue
+            for segment in _segments:
+                owners.setdefault(segment, []).append(position)
+        self._wildcard = tuple(instances[position] for position in wildcard)
+        self._segments = {
+            segment: tuple(instances[position] for position in sorted(set(positions + wildcard)))
+            for segment, positions in owners.items()
+        }
+
+    @staticmethod
+    def segment(url):
+        """
+        Возвращает первую часть пути так же, как её видит поиск маршрута
+
+        :param url: УРЛ
+        :return: str
+        """
+        if url == '/':
+            return 'main'
+        return url.lstrip('/').split('/', 1)[0]
+
+    def candidates(self, url):
+        """
+        Возвращает роутеры, которые могут обработать УРЛ
+
+        :param url: УРЛ
+        :return: tuple
+        """
+        return self._segments.get(self.segment(url), self._wildcard)
@@ -0,0 +1,193 @@
+import email.message
+import email.parser
+import email.utils
+import tempfile
+
+from .error_handler import ApplicationException
+
+#: Размер блока чтения тела запроса
+MULTIPART_CHUNK_SIZE = 64 * 1024
+#: Максимальное количество частей
+MULTIPART_MAX_PARTS = 1000
+#: Максимальный размер значения поля формы
+MULTIPART_MAX_FIELD_SIZE = 1024 * 1024
+#: Максимальный размер заголовков части
+MULTIPART_MAX_HEADER_SIZE = 16 * 1024
+#: Размер файла, после которого он переносится из памяти на диск
+MULTIPART_SPOOL_SIZE = 1024 * 1024
+
+
+def parse_boundary(content_type: str) -> [str, None]:
+    """
+    Возвращает границу частей из заголовка Content-Type: multipart/form-data; boundary=something
+
+    :param content_type: Значение заголовка Content-Type
+    :return: str или None
+    """
+    if not content_type:
+        return None
+    message = email.message.Message()
+    message['Content-Type'] = content_type
+    return message.get_param('boundary')
+
+
+class MultipartPart:
+    """
+    Часть тела multipart/form-data: поле формы (value) или файл (file)
+    """
+
+    __slots__ = ('name', 'filename', 'content_type', 'headers', 'value', 'file', 'size')
+
+    def __init__(self, name, filename, content_type, headers, value=None, file=None, size=0):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers
+        self.value = value
+        self.file = file
+        self.size = size
+
+    @property
+    def is_file(self) -> bool:
+        return self.filename is not None
+
+
+class MultipartParser:
+    """
+    Потоковый разбор multipart/form-data. Тело читается блоками фиксированного размера, границы частей ищутся
+    в буфере, файлы пишутся сразу во временное хранилище (SpooledTemporaryFile), поэтому расход памяти
+    не зависит от размера файлов:
+
+        for part in MultipartParser(environ['wsgi.input'], boundary, content_length):
+            ...
+    """
+
+    def __init__(self, stream, boundary, content_length: int = None, charset: str = 'utf-8',
+                 chunk_size: int = MULTIPART_CHUNK_SIZE, max_parts: int = MULTIPART_MAX_PARTS,
+                 max_field_size: int = MULTIPART_MAX_FIELD_SIZE, max_size: int = None,
+                 spool_size: int = MULTIPART_SPOOL_SIZE):
+        """
+        Конструктор разбора
+
+        :param stream: Входной поток (wsgi.input)
+        :param boundary: Граница частей из заголовка Content-Type
+        :param content_length: Размер тела, None - до конца потока
+        :param charset: Кодировка полей и заголовков частей
+        :param chunk_size: Размер блока чтения
+        :param max_parts: Максимальное количество частей
+        :param max_field_size: Максимальный размер значения поля формы
+        :param max_size: Максимальный размер тела, None - без ограничения
+        :param spool_size: Размер файла, после которого он переносится из памяти на диск
+        """
+        if not boundary:
+            raise ApplicationException(status=400, reason='Multipart boundary is missing')
+        if isinstance(boundary, str):
+            boundary = boundary.strip('"').encode('latin-1')
+        self.stream = stream
+        self.boundary = boundary
+        self.charset = charset
+        self.chunk_size = chunk_size
+        self.max_parts = max_parts
+        self.max_field_size = max_field_size
+        self.max_size = max_size
+        self.spool_size = spool_size
+        if max_size is not None and content_length is not None and content_length > max_size:
+            raise ApplicationException(status=413, reason='Request body is too large')
+        self._remaining = content_length
+        self._total = 0
+
+    def _read(self) -> bytes:
+        size = self.chunk_size if self._remaining is None else min(self.chunk_size, self._remaining)
+        if size <= 0:
+            return b''
+        data = self.stream.read(size)
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        self._total += len(data)
+        if self.max_size is not None and self._total > self.max_size:
+            raise ApplicationException(status=413, reason='Request body is too large')
+        return data
+
+    def _fill(self, buffer: bytearray, size: int) -> bytearray:
+        while len(buffer) < size:
+            data = self._read()
+            if not data:
+                raise ApplicationException(status=400, reason='Malformed multipart body')
+            buffer += data
+        return buffer
+
+    def _scan(self, buffer: bytearray, marker: bytes, sink=None, limit: int = None) -> bytearray:
+        """
+        Читает поток до маркера. Данные до маркера передаются в sink, в буфере остается хвост, который может
+        быть началом маркера
+
+        :param buffer: Прочитанные, но не обработанные данные
+        :param marker: Искомый маркер
+        :param sink: Функция приема данных до маркера, None - данные отбрасываются
+        :param limit: Максимальный размер данных до маркера
+        :return: Данные после маркера
+        """
+        keep = len(marker) - 1
+        written = 0
+        while True:
+            index = buffer.find(marker)
+            end = index if index >= 0 else max(len(buffer) - keep, 0)
+            if end:
+                written += end
+                if limit is not None and written > limit:
+                    raise ApplicationException(status=413, reason='Multipart part is too large')
+                if sink is not None:
+                    sink(bytes(buffer[:end]))
+            if index >= 0:
+                return buffer[index + len(marker):]
+            del buffer[:end]
+            data = self._read()
+            if not data:
+                raise ApplicationException(status=400, reason='Malformed multipart body')
+            buffer += data
+
+    def _headers(self, data: bytes):
+        message = email.parser.HeaderParser().parsestr(data.decode(self.charset, 'replace'))
+        name = message.get_param('name', header='content-disposition')
+        filename = message.get_filename()
+        if isinstance(name, tuple):
+            name = email.utils.collapse_rfc2231_value(name)
+        return message, name, filename
+
+    def __iter__(self):
+        delimiter = b'\r\n--' + self.boundary
+        # Первая граница может стоять в самом начале тела, без CRLF перед ней
+        buffer = self._scan(bytearray(b'\r\n'), delimiter)
+        parts = 0
+        while True:
+            buffer = self._fill(buffer, 2)
+            if buffer[:2] == b'--':
+                return
+            buffer = self._scan(buffer, b'\r\n', limit=1024)
+            parts += 1
+            if parts > self.max_parts:
+                raise ApplicationException(status=413, reason='Too many multipart parts')
+
+            buffer = self._fill(buffer, 2)
+            if buffer[:2] == b'\r\n':
+                header_data = b''
+                buffer = buffer[2:]
+            else:
+                chunks = []
+                buffer = self._scan(buffer, b'\r\n\r\n', chunks.append, limit=MULTIPART_MAX_HEADER_SIZE)
+                header_data = b''.join(chunks)
+            message, name, filename = self._headers(header_data)
+
+            if filename is not None:
+                file = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+                buffer = self._scan(buffer, delimiter, file.write)
+                size = file.tell()
+                file.seek(0)
+                yield MultipartPart(name, filename, message.get('Content-Type'), message.items(),
+                                    file=file, size=size)
+            else:
+                chunks = []
+                buffer = self._scan(buffer, delimiter, chunks.append, limit=self.max_field_size)
+                value = b''.join(chunks)
+                yield MultipartPart(name, None, message.get('Content-Type'), message.items(),
+                                    value=value.decode(self.charset, 'replace'), size=len(value))
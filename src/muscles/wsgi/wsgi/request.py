@@ -1,19 +1,45 @@
-import cgi
 import urllib
 from urllib.parse import urlparse, urlunparse
 from operator import itemgetter
+from functools import wraps
 
 from muscles.core import Dependency
 from muscles.core import EventsStorageInterface
 from muscles.core import inject
-import json
 import sys
 import email.parser
 import tempfile
 import os
+import shutil
+import threading
 import magic
 from http.cookies import SimpleCookie
 from .error_handler import ApplicationException, AttributeException
+from . import codec
+from .multipart import MultipartParser, parse_boundary, MULTIPART_MAX_PARTS, MULTIPART_MAX_FIELD_SIZE, \
+    MULTIPART_SPOOL_SIZE
+
+#: Размер блока копирования при сохранении файла
+FILE_COPY_CHUNK_SIZE = 64 * 1024
+#: Размер начала содержимого, по которому определяется MIME тип
+MIME_SNIFF_SIZE = 4096
+
+_magic = threading.local()
+
+
+def sniff_mime_type(data: bytes) -> [str, None]:
+    """
+    Определяет MIME тип по началу содержимого. Экземпляр libmagic создается один раз на поток
+
+    :param data: Содержимое или его начало
+    :return: str или None для пустого содержимого
+    """
+    if not data:
+        return None
+    mime = getattr(_magic, 'mime', None)
+    if mime is None:
+        mime = _magic.mime = magic.Magic(mime=True)
+    return mime.from_buffer(bytes(data[:MIME_SNIFF_SIZE]))
 
 
 def _split_on_find(content, bound):
@@ -107,20 +133,36 @@ class FileStorage:
     Хранилище файлов
     """
 
-    def __init__(self, name, value, filename=None, mime_type=None, file_type=None, bytes_read=0):
+    def __init__(self, name, value=None, filename=None, mime_type=None, file_type=None, bytes_read=0, fp=None,
+                 spool_size: int = MULTIPART_SPOOL_SIZE, keep_value: bool = True):
+        """
+        Конструктор хранилища. Содержимое хранится в SpooledTemporaryFile: в памяти до spool_size байт,
+        больше - во временном файле на диске
+
+        :param name: Имя поля формы
+        :param value: Содержимое файла
+        :param filename: Имя файла
+        :param mime_type: MIME тип, None - определяется по содержимому при первом обращении
+        :param file_type: Тип файла из запроса
+        :param bytes_read: Размер файла
+        :param fp: Открытый файл с содержимым (например, из разбора multipart), используется вместо value
+        :param spool_size: Размер содержимого, после которого оно переносится из памяти на диск
+        :param keep_value: Хранить копию содержимого в bytes. False - value каждый раз читается из файла,
+            а переданное value не удерживается
+        """
         self._name = name
-        self._value = value
-        # TODO Если оставить сохранение в файл то открывается уязвимость переполнения файловой системы,
-        #  лучше переделать на поток
-        self.fp = tempfile.NamedTemporaryFile(prefix="tempfile_", suffix="_muscular")
-        self.fp.write(self._value)
-        self.fp.seek(0)
-        self._filepath = self.fp.name
+        self._keep_value = keep_value
+        if fp is None:
+            fp = tempfile.SpooledTemporaryFile(max_size=spool_size, prefix="tempfile_", suffix="_muscular")
+            if value:
+                fp.write(value)
+                fp.seek(0)
+        self.fp = fp
+        filepath = getattr(fp, 'name', None)
+        self._filepath = filepath if isinstance(filepath, str) else None
         self._filename = filename
         self._file_type = file_type
-        if mime_type is None:
-            mime = magic.Magic(mime=True)
-            mime_type = mime.from_buffer(self._value)
+        self._value = value if keep_value else None
         self._mime_type = mime_type
         self._bytes_read = bytes_read
 
@@ -173,16 +215,40 @@ class FileStorage:
         """
         return self._bytes_read
 
+    @property
+    def mime_type(self):
+        """
+        MIME тип, определяется по началу содержимого при первом обращении
+        :return: string
+        """
+        if self._mime_type is None:
+            if self._value is not None:
+                head = self._value[:MIME_SNIFF_SIZE]
+            else:
+                position = self.fp.tell()
+                self.fp.seek(0)
+                head = self.fp.read(MIME_SNIFF_SIZE)
+                self.fp.seek(position)
+            self._mime_type = sniff_mime_type(head)
+        return self._mime_type
+
     @property
     def value(self):
-        return self._value
+        if self._value is not None:
+            return self._value
+        self.fp.seek(0)
+        value = self.fp.read()
+        self.fp.seek(0)
+        if self._keep_value:
+            self._value = value
+        return value
 
     def __str__(self):
-        return "FileStorage(%r, %r)" % (self._mime_type, self.filename)
+        return "FileStorage(%r, %r)" % (self.mime_type, self.filename)
 
     def __repr__(self):
         """Возвращает строку для отображения"""
-        return "FileStorage(%r, %r)" % (self._mime_type, self.filename)
+        return "FileStorage(%r, %r)" % (self.mime_type, self.filename)
 
     def __enter__(self):
         return self
@@ -192,16 +258,18 @@ class FileStorage:
 
     def save(self, filepath=None):
         """
-        Сохраняет файл по указаному пути
+        Сохраняет файл по указаному пути копированием блоками, без чтения содержимого в память
         :param filepath: путь сохранения файла
         :return: None
         """
-        self._filepath = os.path.abspath(filepath)
-        self._filename = os.path.basename(self._filepath)
-        fp = open(filepath, 'wb')
-        fp.write(self.fp.read())
+        filepath = os.path.abspath(filepath)
+        self.fp.seek(0)
+        with open(filepath, 'wb') as fp:
+            shutil.copyfileobj(self.fp, fp, FILE_COPY_CHUNK_SIZE)
         self.fp.close()
-        self.fp = fp
+        self.fp = open(filepath, 'rb')
+        self._filepath = filepath
+        self._filename = os.path.basename(filepath)
 
 
 class FieldStorage:
@@ -240,11 +308,44 @@ class FieldStorage:
         return self
 
 
+def memoized_property(func):
+    """
+    Свойство запроса, которое вычисляется при первом обращении и запоминается в слоте `_memo_<имя>` экземпляра.
+    Слот должен быть объявлен в Request._memo_slots
+
+    :param func: Функция вычисления свойства
+    :return: property
+    """
+    slot = '_memo_%s' % func.__name__
+
+    @wraps(func)
+    def getter(self):
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            value = func(self)
+            setattr(self, slot, value)
+            return value
+
+    return property(getter)
+
+
 class Request:
     """
     Тело запроса к сервверу
     """
 
+    # __dict__ создается только при установке атрибутов, которых нет в списке (например, request.session
+    # из before_request), основные атрибуты и значения свойств хранятся в слотах
+    #: Слоты значений memoized_property
+    _memo_slots = ('_memo_prefix', '_memo_query', '_memo_m_query', '_memo_raw_query', '_memo_cookies',
+                   '_memo_content_length', '_memo_accept_language', '_memo_accept_encoding', '_memo_accept',
+                   '_memo_content_type', '_memo_boundary', '_memo_content_charset', '_memo_charset')
+    __slots__ = ('parts', '_is_json', '_is_xml', '_is_form', '_is_buffer', '_method', 'protocol', 'url', 'server',
+                 '_headers', 'remote_addr', '_exception', '_body', '_loader', '_stream', 'scheme', 'netloc', 'path',
+                 '_query', 'fragment', 'username', 'password', 'hostname', 'port', 'route', 'actor', 'itinerary',
+                 '__dict__', '__weakref__') + _memo_slots
+
     __charset = 'utf8'
     _before_start = []
 
@@ -260,6 +361,8 @@ class Request:
                  is_xml=False,
                  is_form=False,
                  is_buffer=False,
+                 loader=None,
+                 stream=None,
                  **kwargs
                  ):
         """
@@ -272,6 +375,8 @@ class Request:
         :param remote_addr: Откуда поступил запрос
         :param headers: Заголовки запроса
         :param body: Тело запроса
+        :param loader: Функция разбора тела запроса, вызывается при первом обращении к телу
+        :param stream: Входной поток тела запроса (wsgi.input)
         :param kwargs:
         """
 
@@ -292,8 +397,8 @@ class Request:
         #: The address of the server. ``(host, port)``, ``(path, None)``
         #: for unix sockets, or ``None`` if not known.
         self.server = server
-        #: The headers received with the request.
-        self.headers = headers
+        #: The headers received with the request. Свойства еще не вычислены, поэтому сброс через сеттер не нужен
+        self._headers = headers
         #: The address of the client sending the request.
         self.remote_addr = remote_addr
 
@@ -303,6 +408,8 @@ class Request:
         else:
             self._body = body
             self._exception = None
+        self._loader = loader
+        self._stream = stream
 
         o = urlparse(self.url)
         self.scheme = o.scheme
@@ -317,6 +424,7 @@ class Request:
 
         self.route = None
         self.actor = None
+        self.itinerary = None
 
         """ Запускает обработку событий инициализации запроса Request """
         events = Dependency.resolve(EventsStorageInterface)
@@ -361,6 +469,22 @@ class Request:
         return decorator
 
     @property
+    def headers(self) -> dict:
+        """
+        Заголовки запроса
+        """
+        return self._headers
+
+    @headers.setter
+    def headers(self, headers: dict):
+        self._headers = headers
+        for slot in self._memo_slots:
+            try:
+                delattr(self, slot)
+            except AttributeError:
+                pass
+
+    @memoized_property
     def prefix(self) -> bool:
         """
         Префикс к адресу
@@ -461,14 +585,14 @@ class Request:
             scheme=self.scheme, hostname=self.hostname, port=self.port
         )
 
-    @property
+    @memoized_property
     def query(self) -> dict:
         """
         Получаем часть запроса query в формате ключ/значение
         """
         return dict(urllib.parse.parse_qsl(self._query))
 
-    @property
+    @memoized_property
     def m_query(self) -> dict:
         """
         Получаем часть запроса query в формате ключ/[значения] или ключ/значение
@@ -488,14 +612,14 @@ class Request:
                     params.update({val[0]: val[1]})
         return params
 
-    @property
+    @memoized_property
     def raw_query(self) -> list:
         """
         Получаем часть запроса query в RAW формате
         """
         return urllib.parse.parse_qsl(self._query)
 
-    @property
+    @memoized_property
     def cookies(self) -> "ImmutableMultiDict[str, str]":
         """
         Печеньки запроса
@@ -508,7 +632,7 @@ class Request:
         else:
             return {}
 
-    @property
+    @memoized_property
     def content_length(self) -> [int, None]:
         """
         Размер запроса
@@ -525,7 +649,7 @@ class Request:
 
         return None
 
-    @property
+    @memoized_property
     def accept_language(self) -> []:
         """
         Язык запроса
@@ -546,7 +670,7 @@ class Request:
                 pass
         return None
 
-    @property
+    @memoized_property
     def accept_encoding(self) -> [str, None]:
         """
         Кодировка запроса
@@ -567,7 +691,7 @@ class Request:
                 pass
         return None
 
-    @property
+    @memoized_property
     def accept(self) -> [str, None]:
         """
         Accept: text/html, application/xhtml+xml, application/xml;q=0.9, */*;q=0.8
@@ -588,7 +712,7 @@ class Request:
                 pass
         return None
 
-    @property
+    @memoized_property
     def content_type(self) -> [str, None]:
         """
         Content-Type: text/html; charset=UTF-8 => text/html
@@ -604,7 +728,7 @@ class Request:
 
         return None
 
-    @property
+    @memoized_property
     def boundary(self) -> [str, None]:
         """
 
@@ -637,7 +761,7 @@ class Request:
 
         return None
 
-    @property
+    @memoized_property
     def content_charset(self) -> [str, None]:
         """
         Content-Type: text/html; charset=UTF-8 => utf-8
@@ -655,7 +779,7 @@ class Request:
 
         return None
 
-    @property
+    @memoized_property
     def charset(self) -> [str, None]:
         """
         Кодировка
@@ -663,13 +787,47 @@ class Request:
         """
         return self.content_charset if self.content_charset else self.__charset
 
+    def load_body(self):
+        """
+        Разбирает тело запроса при первом обращении и запоминает результат. Ошибка разбора
+        также запоминается и выбрасывается при каждом обращении
+
+        :return: Тело запроса
+        """
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            try:
+                self._body = loader()
+            except Exception as ex:
+                self._body = ex
+        if isinstance(self._body, BaseException):
+            raise self._body
+        return self._body
+
+    @property
+    def is_loaded(self) -> bool:
+        """
+        Тело запроса уже прочитано и разобрано
+        :return:
+        """
+        return self._loader is None
+
+    @property
+    def stream(self):
+        """
+        Входной поток тела запроса (wsgi.input) для чтения без разбора. После обращения к json, forms, files,
+        body или raw поток уже прочитан
+        :return:
+        """
+        return self._stream
+
     @property
     def json(self):
         """
         Разбор тела пост запроса
         :return:
         """
-        return self._body if self._is_json else {}
+        return self.load_body() if self._is_json else {}
 
     @property
     def xml(self):
@@ -677,7 +835,7 @@ class Request:
         Разбор тела пост запроса
         :return:
         """
-        return self._body if self._is_xml else {}
+        return self.load_body() if self._is_xml else {}
 
     @property
     def is_xml(self):
@@ -701,9 +859,10 @@ class Request:
         Разбор тела пост запроса
         :return:
         """
-        if self._body is None:
+        body = self.load_body()
+        if body is None:
             raise AttributeException(reason="request.body is empty")
-        return self._body if not self._is_buffer else None
+        return body if not self._is_buffer else None
 
     @property
     def raw(self):
@@ -711,10 +870,7 @@ class Request:
         Разбор тела пост запроса
         :return:
         """
-        try:
-            return self._body
-        except Exception:
-            return None
+        return self.load_body()
 
     @property
     def forms(self):
@@ -728,15 +884,15 @@ class Request:
         """
         if not self._is_form:
             return None
+        body = self.load_body()
         fields = {}
-        for part in self._body:
-            if isinstance(self._body[part], FieldStorage):
-                fields[part] = self._body[part]
-            elif isinstance(self._body[part], list):
-                fields[part] = []
-                for el_part in self._body[part]:
-                    if isinstance(el_part, FieldStorage):
-                        fields[part].append(el_part)
+        for part in body:
+            if isinstance(body[part], FieldStorage):
+                fields[part] = body[part]
+            elif isinstance(body[part], list):
+                el_fields = [el_part for el_part in body[part] if isinstance(el_part, FieldStorage)]
+                if el_fields:
+                    fields[part] = el_fields
         return fields
 
     @property
@@ -745,7 +901,7 @@ class Request:
         Разбор формы запроса
         :return:
         """
-        return self._body if self._is_buffer else None
+        return self.load_body() if self._is_buffer else None
 
     @property
     def files(self):
@@ -755,10 +911,15 @@ class Request:
         """
         if not self._is_form:
             return None
+        body = self.load_body()
         files = {}
-        for part in self._body:
-            if isinstance(self._body[part], FileStorage):
-                files[part] = self._body[part]
+        for part in body:
+            if isinstance(body[part], FileStorage):
+                files[part] = body[part]
+            elif isinstance(body[part], list):
+                el_files = [el_part for el_part in body[part] if isinstance(el_part, FileStorage)]
+                if el_files:
+                    files[part] = el_files
         return files
 
     @property
@@ -778,6 +939,14 @@ class RequestMaker:
         'text/javascript',
         'text/javascript'
     ]
+    #: Максимальное количество частей multipart/form-data
+    multipart_max_parts = MULTIPART_MAX_PARTS
+    #: Максимальный размер значения поля multipart/form-data
+    multipart_max_field_size = MULTIPART_MAX_FIELD_SIZE
+    #: Максимальный размер тела multipart/form-data, None - без ограничения
+    multipart_max_size = None
+    #: Размер файла, после которого он переносится из памяти на диск
+    multipart_spool_size = MULTIPART_SPOOL_SIZE
 
     def __init__(self, environ):
         self.environ = environ
@@ -818,19 +987,33 @@ class RequestMaker:
 
     def make_body_from_multipart(self):
         fields = {}
-        wsgi_input = cgi.FieldStorage(fp=self.environ['wsgi.input'], environ=self.environ, keep_blank_values=True)
-        for name in wsgi_input.keys():
-            if hasattr(wsgi_input[name], 'filename') and wsgi_input[name].filename is not None:
-                wsgi_input[name].file.seek(0)
-                fields[name] = FileStorage(name, wsgi_input[name].file.read(),
-                                           filename=wsgi_input[name].filename,
-                                           file_type=wsgi_input[name].type,
-                                           bytes_read=wsgi_input[name].bytes_read,
-                                           )
+        try:
+            length = int(self.environ.get('CONTENT_LENGTH', ''))
+        except ValueError:
+            length = None
+        parser = MultipartParser(self.environ['wsgi.input'], parse_boundary(self.environ.get('CONTENT_TYPE')),
+                                 content_length=length,
+                                 charset=self.charset,
+                                 max_parts=self.multipart_max_parts,
+                                 max_field_size=self.multipart_max_field_size,
+                                 max_size=self.multipart_max_size,
+                                 spool_size=self.multipart_spool_size)
+        for part in parser:
+            if part.is_file:
+                field = FileStorage(part.name,
+                                    filename=part.filename,
+                                    file_type=part.content_type,
+                                    bytes_read=part.size,
+                                    fp=part.file,
+                                    )
             else:
-                wsgi_input[name].file.seek(0)
-                fields[name] = FieldStorage(name, wsgi_input[name].file.read())
-
+                field = FieldStorage(part.name, part.value)
+            if fields.get(part.name) and isinstance(fields[part.name], list):
+                fields[part.name].append(field)
+            elif fields.get(part.name):
+                fields[part.name] = [fields[part.name], field]
+            else:
+                fields[part.name] = field
         return fields
 
     def make_body_from_buffer(self):
@@ -838,6 +1021,8 @@ class RequestMaker:
             length = int(self.environ.get('CONTENT_LENGTH', '0'))
         except ValueError:
             length = 0
+        if length <= 0:
+            return b''
         wsgi_input = self.environ['wsgi.input']
         if 'wsgi.file_wrapper' in self.environ:
             wsgi_input = self.environ['wsgi.file_wrapper'](wsgi_input, length)
@@ -845,8 +1030,9 @@ class RequestMaker:
 
     def make_body_from_raw(self):
         wsgi_input = self.make_body_from_buffer()
-        mime = magic.Magic(mime=True)
-        mime_type = mime.from_buffer(wsgi_input)
+        if not wsgi_input:
+            return wsgi_input
+        mime_type = sniff_mime_type(wsgi_input)
         if mime_type not in self.text_mime_types:
             wsgi_input = FileStorage(None, wsgi_input,
                                      filename=None,
@@ -860,18 +1046,21 @@ class RequestMaker:
         wsgi_input = self.make_body_from_buffer()
         try:
             if len(wsgi_input) > 0:
-                return json.loads(wsgi_input.decode(self.charset))
+                return codec.loads(wsgi_input, charset=self.charset)
             else:
                 return {}
-        except json.JSONDecodeError as e:
-            raise ApplicationException(reason="JSON DECODE ERROR", body=e)
-        except UnicodeDecodeError as e:
-            raise ApplicationException(reason="JSON DECODE ERROR", body=e)
+        except ValueError as e:
+            # json.JSONDecodeError, UnicodeDecodeError и ошибки разбора orjson/ujson
+            raise ApplicationException(status=400, reason="JSON DECODE ERROR", body=e)
 
     def make_body_from_form(self):
         wsgi_input = self.make_body_from_buffer()
         fields = {}
-        data = urllib.parse.parse_qsl(wsgi_input.decode(self.charset))
+        try:
+            data = urllib.parse.parse_qsl(wsgi_input.decode(self.charset))
+        except (ValueError, LookupError) as e:
+            # UnicodeDecodeError и неизвестная кодировка из заголовка Content-Type
+            raise ApplicationException(status=400, reason="FORM DECODE ERROR", body=e)
         for _data in data:
             if fields.get(_data[0]) and isinstance(fields[_data[0]], list):
                 fields[_data[0]].append(FieldStorage(_data[0], _data[1]))
@@ -900,19 +1089,18 @@ class RequestMaker:
 
     def make(self) -> Request:
         """
-        Формируем объект Request
+        Формируем объект Request. Тело запроса не читается: оно разбирается при первом обращении
+        к json, forms, files, body или raw, поэтому запросы, отклоненные до обработчика (404, before_request),
+        не тратят время на разбор тела
 
         :return: Request
         """
         environ = self.environ
-        if self.request_type and hasattr(self, "make_body_from_%s" % self.request_type):
-            try:
-                method = getattr(self, "make_body_from_%s" % self.request_type)
-                wsgi_input = method()
-            except ApplicationException as ex:
-                wsgi_input = ex
+        request_type = self.request_type
+        if request_type and hasattr(self, "make_body_from_%s" % request_type):
+            loader = getattr(self, "make_body_from_%s" % request_type)
         else:
-            wsgi_input = self.make_body_from_raw()
+            loader = self.make_body_from_raw
         request = Request(
             method=environ['REQUEST_METHOD'],
             protocol=environ['SERVER_PROTOCOL'],
@@ -920,10 +1108,11 @@ class RequestMaker:
             server=(environ['SERVER_NAME'], environ['SERVER_PORT']),
             remote_addr=(environ['REMOTE_ADDR'], environ['REMOTE_PORT']),
             headers=self.make_headers(),
-            body=wsgi_input,
-            is_json=self.request_type == 'json',
-            is_xml=self.request_type == 'xml',
-            is_form=self.request_type == 'multipart' or self.request_type == 'form',
-            is_buffer=self.request_type is None
+            loader=loader,
+            stream=environ.get('wsgi.input'),
+            is_json=request_type == 'json',
+            is_xml=request_type == 'xml',
+            is_form=request_type == 'multipart' or request_type == 'form',
+            is_buffer=request_type is None
         )
         return request
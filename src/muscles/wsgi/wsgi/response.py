@@ -1,7 +1,9 @@
 import codecs
+import io
 import json
+import os
+import struct
 import traceback
-from json import JSONEncoder
 from typing import Optional, Union
 
 from .request import Request
@@ -11,11 +13,15 @@ from muscles.core import BaseModel, Collection
 from .http_code import code_status
 from .error_handler import ApplicationException
 from .error_handler import ErrorsException
+from . import codec
+from .codec import ObjectJSONEncoder
+from .conditional import body_etag
+from .streaming import ClosingIterator, iter_ndjson, iter_json_array, iter_events, iter_queue, \
+    SSE_HEARTBEAT_INTERVAL
 
 
-class ObjectJSONEncoder(JSONEncoder):
-    def default(self, obj):
-        return str(obj)
+#: Длина заголовка ответа в общем хранилище кэша
+_CACHED_META = struct.Struct('!I')
 
 
 class BaseResponse:
@@ -27,6 +33,11 @@ class BaseResponse:
     _body: Union[BaseModel, str, int, tuple, dict, list, bytes, bool, None] = None
     _errors: Union[BaseModel, str, int, tuple, dict, list, bytes, bool, None] = None
     _file: Union[str, None] = None
+    _content: Union[bytes, str, None] = None
+    #: ETag ответа, заданный до формирования тела (токен версии обработчика)
+    etag: Union[str, None] = None
+    #: Формировать ETag по готовому телу ответа
+    auto_etag: bool = False
 
     def __init__(self, *args,
                  status: Union[str, int, None] = None,
@@ -63,30 +74,10 @@ class BaseResponse:
         self._errors = errors
 
     def make_body(self):
-        def _recursive_dict_adapt(dictionary):
-            if isinstance(dictionary, dict):
-                new_dict = {}
-                for key, value in dictionary.items():
-                    new_dict[key] = _recursive_dict_adapt(value)
-                return new_dict
-            elif isinstance(dictionary, list):
-                new_list = []
-                for value in dictionary:
-                    new_list.append(_recursive_dict_adapt(value))
-                return new_list
-            elif isinstance(dictionary, BaseModel) or isinstance(dictionary, Collection):
-                return dictionary.to_json()
-            else:
-                return dictionary
         body = self.body or self.errors
         if self.type in ['json'] or isinstance(body, dict):
             try:
-                body = _recursive_dict_adapt(body)
-                body = json.dumps(body, cls=ObjectJSONEncoder)
-                if isinstance(body, str):
-                    body = codecs.encode(body, encoding='utf-8')
-                elif isinstance(body, bool):
-                    body = "true" if body else "false"
+                body = codec.dumps(body)
             except ValueError as e:
                 # traceback.format_exc()
                 raise ApplicationException(status=500, reason=e, body=traceback.format_exc())
@@ -100,6 +91,17 @@ class BaseResponse:
                 body = "true" if body else "false"
         return body
 
+    @property
+    def content(self):
+        """
+        Тело ответа, сериализованное один раз за запрос. Повторные обращения (заголовки, отправка, отладка)
+        используют готовые байты
+        :return:
+        """
+        if self._content is None:
+            self._content = self.make_body()
+        return self._content
+
     @staticmethod
     def schema(child=None):
         if child is None:
@@ -157,12 +159,13 @@ class BaseResponse:
             if content_type is None:
                 content_type = "application/octet-stream"
             headers.append(('Content-Type', content_type))
+            headers.append(('Content-Length', str(os.stat(self._file).st_size)))
             # Don't send encoding for attachments, it causes browsers to
             # save decompress tar.gz files.
             if encoding is not None:
                 headers.append(("Content-Encoding", encoding))
         elif self.body:
-            headers.append(('Content-Length', str(len(self.make_body()))))
+            headers.append(('Content-Length', str(len(self.content))))
             headers.append(('Content-Type', content_type))
 
         headers.append(('Server', str(' '.join([__name__, __version__]))))
@@ -198,6 +201,27 @@ class BaseResponse:
     @body.setter
     def body(self, value):
         self._body = value
+        self._content = None
+
+    @property
+    def file_path(self):
+        """
+        Путь к файлу ответа
+        :return:
+        """
+        return self._file
+
+    def open_file(self):
+        """
+        Открывает файл ответа
+        :return: (открытый файл, результат os.stat)
+        """
+        fp = io.open(self._file, 'rb')
+        try:
+            return fp, os.fstat(fp.fileno())
+        except Exception:
+            fp.close()
+            raise
 
     @property
     def errors(self):
@@ -302,6 +326,15 @@ class BaseResponse:
             url = redirection
         return Response(status=status, reason=reason, headers=[('Location', url)])
 
+    @staticmethod
+    def not_modified(headers: Optional[list] = None):
+        """
+        Формирует ответ без тела - Ресурс не изменился
+        :param headers: Заголовки ответа (ETag, Last-Modified, Cache-Control)
+        :return:
+        """
+        return BaseResponse(status=304, headers=headers)
+
     @staticmethod
     def not_found(reason=None):
         """
@@ -311,6 +344,14 @@ class BaseResponse:
         """
         return Response(status=404, reason=reason)
 
+    @property
+    def is_stream(self):
+        """
+        Тело ответа отдается по частям
+        :return: bool
+        """
+        return False
+
     @property
     def http_status(self):
         """
@@ -323,24 +364,265 @@ class BaseResponse:
         return '%s %s' % (self.status, reason)
 
 
-class Response(BaseResponse):
+class CachedFileResponse(BaseResponse):
+    """
+    Ответ файлом из кэша файлов в памяти. Заголовки файла вычислены заранее, диск не читается
+    """
+
+    def __init__(self, cached, status: Union[str, int, None] = 200, headers: list[tuple] = None,
+                 request: Union[Request, None] = None):
+        """
+        Конструктор ответа
+
+        :param cached: Запись кэша файлов CachedFile
+        :param status: HTTP Код статуса ответа
+        :param headers: Заголовки ответа
+        :param request: Объект запроса
+        """
+        super().__init__(status=status, file=cached.path, headers=headers, request=request)
+        self.cached = cached
+
+    @property
+    def headers(self):
+        headers = [(str(header[0]), str(header[1])) for header in self._headers
+                   if header[0] not in ('Content-Length', 'Content-Type')]
+        headers += self.cached.headers
+        headers.append(('Server', str(' '.join([__name__, __version__]))))
+        return headers
+
+    @headers.setter
+    def headers(self, headers):
+        self._headers = headers
+
+    def open_file(self):
+        """
+        Открывает файл ответа из памяти
+        :return: (открытый файл, результат os.stat)
+        """
+        return io.BytesIO(self.cached.data), self.cached.stat
+
+
+class CachedResponse(BaseResponse):
+    """
+    Готовый ответ из кэша ответов: статус, заголовки и тело сохранены после сериализации и отдаются как есть
+    """
+
+    def __init__(self, status, headers: list[tuple], content: bytes, reason: Union[str, None] = None):
+        """
+        Конструктор ответа
+
+        :param status: HTTP Код статуса ответа
+        :param headers: Готовые заголовки ответа
+        :param content: Готовое тело ответа
+        :param reason: Расшифровка статуса ответа
+        """
+        super().__init__(status=status, headers=headers, reason=reason)
+        self._content = content
+
+    @staticmethod
+    def freeze(response: BaseResponse):
+        """
+        Сохраняет готовый ответ для кэша. Потоковые ответы, файлы, ответы с cookie и ошибки не сохраняются
+        :param response: Объект ответа
+        :return: CachedResponse или None
+        """
+        if isinstance(response, CachedResponse):
+            return response
+        if response.status != '200' or response.is_stream or response.file_path is not None:
+            return None
+        content = response.content
+        headers = response.headers
+        if not isinstance(content, bytes) or any(header[0].lower() == 'set-cookie' for header in headers):
+            return None
+        frozen = CachedResponse(response.status, headers, content, reason=response._reason)
+        frozen.etag = response.etag
+        if frozen.etag is None and response.auto_etag:
+            frozen.etag = body_etag(content)
+        return frozen
+
+    def dumps(self) -> bytes:
+        """
+        Сериализует ответ для общего хранилища кэша: длина заголовка, заголовок JSON (статус, заголовки,
+        расшифровка статуса, ETag) и тело ответа как есть. Формат не исполняет код при разборе, в отличие от pickle
+
+        :return: bytes
+        """
+        reason = None if self._reason is None else str(self._reason)
+        meta = json.dumps([self.status, [list(header) for header in self._headers], reason, self.etag],
+                          separators=(',', ':')).encode('utf-8')
+        return _CACHED_META.pack(len(meta)) + meta + self._content
+
+    @staticmethod
+    def loads(data: bytes):
+        """
+        Восстанавливает ответ из общего хранилища кэша
+
+        :param data: Результат dumps
+        :return: CachedResponse
+        """
+        if len(data) < _CACHED_META.size:
+            raise ValueError('Cached response is truncated')
+        size, = _CACHED_META.unpack_from(data)
+        end = _CACHED_META.size + size
+        if len(data) < end:
+            raise ValueError('Cached response is truncated')
+        meta = json.loads(data[_CACHED_META.size:end].decode('utf-8'))
+        if not isinstance(meta, list) or len(meta) != 4:
+            raise ValueError('Cached response is malformed')
+        status, headers, reason, etag = meta
+        response = CachedResponse(status, [(str(name), str(value)) for name, value in headers], bytes(data[end:]),
+                                  reason=reason)
+        response.etag = etag
+        return response
+
+    def make_body(self):
+        return self._content
+
+    @property
+    def headers(self):
+        return list(self._headers)
+
+    @headers.setter
+    def headers(self, headers):
+        self._headers = headers
+
+
+class StreamingResponse(BaseResponse):
+    """
+    Потоковый ответ. Тело - итерируемый объект или генератор, части передаются WSGI серверу по мере получения,
+    без Content-Length и без сборки всего ответа в памяти
+    """
+
+    def __init__(self, iterable, status: Union[str, int, None] = 200, headers: list[tuple] = None,
+                 content_type: str = 'text/html; charset=utf-8', charset: str = 'utf-8', on_close=None,
+                 reason: Union[str, None] = None, request: Union[Request, None] = None):
+        """
+        Конструктор ответа
+
+        :param iterable: Части ответа: bytes или str
+        :param status: HTTP Код статуса ответа
+        :param headers: Заголовки ответа
+        :param content_type: Тип контента
+        :param charset: Кодировка строковых частей
+        :param on_close: Обработчик или список обработчиков, вызываемых после отправки ответа
+        :param reason: Расшифровка статуса ответа
+        :param request: Объект запроса
+        """
+        super().__init__(status=status, headers=headers, reason=reason, request=request)
+        self.stream = iterable
+        self.content_type = content_type
+        self.charset = charset
+        if on_close is None:
+            on_close = []
+        self.close_hooks = list(on_close) if isinstance(on_close, (list, tuple)) else [on_close]
+
+    def on_close(self, func):
+        """
+        Добавляет обработчик, вызываемый после отправки ответа или при разрыве соединения
+        :param func: Обработчик без аргументов
+        :return: func
+        """
+        self.close_hooks.append(func)
+        return func
+
     def make_body(self):
-        def _recursive_dict_adapt(dictionary):
-            if isinstance(dictionary, dict):
-                new_dict = {}
-                for key, value in dictionary.items():
-                    new_dict[key] = _recursive_dict_adapt(value)
-                return new_dict
-            elif isinstance(dictionary, list):
-                new_list = []
-                for value in dictionary:
-                    new_list.append(_recursive_dict_adapt(value))
-                return new_list
-            elif isinstance(dictionary, BaseModel) or isinstance(dictionary, Collection):
-                return dictionary.to_json()
-            else:
-                return dictionary
+        return ClosingIterator(self.stream, charset=self.charset, callbacks=self.close_hooks)
+
+    @property
+    def is_stream(self):
+        return True
 
+    @property
+    def headers(self):
+        headers = [(str(header[0]), str(header[1])) for header in self._headers
+                   if header[0] not in ('Content-Length', 'Content-Type')]
+        headers.append(('Content-Type', self.content_type))
+        headers.append(('Server', str(' '.join([__name__, __version__]))))
+        return headers
+
+    @headers.setter
+    def headers(self, headers):
+        self._headers = headers
+
+
+class JsonStreamResponse(StreamingResponse):
+    """
+    Потоковый JSON ответ для больших коллекций. Модели сериализуются по одной по мере чтения коллекции,
+    поэтому память не зависит от размера результата, а первые байты уходят до получения последней модели
+    """
+
+    def __init__(self, items, status: Union[str, int, None] = 200, headers: list[tuple] = None,
+                 ndjson: bool = False, envelope: dict = None, key: str = 'data', on_close=None,
+                 request: Union[Request, None] = None):
+        """
+        Конструктор ответа
+
+        :param items: Collection или любой итерируемый объект моделей
+        :param status: HTTP Код статуса ответа
+        :param headers: Заголовки ответа
+        :param ndjson: Формат application/x-ndjson вместо JSON массива
+        :param envelope: Объект-обертка JSON массива, например {"status": "SUCCESS"}
+        :param key: Ключ массива в обертке
+        :param on_close: Обработчик или список обработчиков, вызываемых после отправки ответа
+        :param request: Объект запроса
+        """
+        if ndjson:
+            stream, content_type = iter_ndjson(items), 'application/x-ndjson'
+        else:
+            stream, content_type = iter_json_array(items, envelope=envelope, key=key), \
+                'application/json; charset=utf-8'
+        super().__init__(stream, status=status, headers=headers, content_type=content_type, on_close=on_close,
+                         request=request)
+        self.items = items
+        if hasattr(items, 'close'):
+            self.close_hooks.append(items.close)
+
+
+class EventSourceResponse(StreamingResponse):
+    """
+    Ответ Server-Sent Events. События отправляются по мере появления, без опроса клиентом.
+    Разрыв соединения обнаруживается при отправке очередного события или комментария: WSGI сервер прекращает
+    чтение потока и вызывает обработчики закрытия (on_close), где нужно отписаться от источника событий
+    """
+
+    def __init__(self, source, status: Union[str, int, None] = 200, headers: list[tuple] = None,
+                 retry: int = None, heartbeat: float = SSE_HEARTBEAT_INTERVAL, on_close=None,
+                 request: Union[Request, None] = None):
+        """
+        Конструктор ответа
+
+        :param source: Очередь событий (queue.Queue, gevent.queue.Queue) или итерируемый объект событий
+        :param status: HTTP Код статуса ответа
+        :param headers: Заголовки ответа
+        :param retry: Интервал переподключения клиента в миллисекундах
+        :param heartbeat: Интервал комментариев для очереди событий в секундах
+        :param on_close: Обработчик или список обработчиков, вызываемых после отключения клиента
+        :param request: Объект запроса
+        """
+        if headers is None:
+            headers = []
+        headers = headers + [('Cache-Control', 'no-cache'), ('X-Accel-Buffering', 'no')]
+        events = iter_queue(source, heartbeat=heartbeat) \
+            if hasattr(source, 'get') and not isinstance(source, dict) else source
+        super().__init__(iter_events(events, retry=retry), status=status, headers=headers,
+                         content_type='text/event-stream; charset=utf-8', on_close=on_close, request=request)
+        self.source = source
+        if hasattr(source, 'close'):
+            self.close_hooks.append(source.close)
+
+    @property
+    def last_event_id(self):
+        """
+        Идентификатор последнего полученного клиентом события при переподключении
+        :return: str или None
+        """
+        if self.request is None:
+            return None
+        return self.request.headers.get('Last-Event-ID')
+
+
+class Response(BaseResponse):
+    def make_body(self):
         body = self.body
         errors = self.errors
         if self.type in ['json']:
@@ -358,19 +640,16 @@ class Response(BaseResponse):
                     status = "UNPROCESSABLE ENTITY"
                 else:
                     status = "FAIL"
-                body = _recursive_dict_adapt(body)
-                errors = _recursive_dict_adapt(errors)
                 if status == "SUCCESS":
-                    body = json.dumps({
+                    body = codec.dumps({
                         "status": status,
                         "data": body,
-                    }, cls=ObjectJSONEncoder)
+                    })
                 else:
-                    body = json.dumps({
+                    body = codec.dumps({
                         "status": status,
                         "error": body,
-                    }, cls=ObjectJSONEncoder)
-                body = codecs.encode(body, encoding='utf-8')
+                    })
             except ValueError as e:
                 traceback.print_stack()
                 raise Exception(500, e)
@@ -438,22 +717,6 @@ class Response(BaseResponse):
 
 class BadResponse(Response):
     def make_body(self):
-        def _recursive_dict_adapt(dictionary):
-            if isinstance(dictionary, dict):
-                new_dict = {}
-                for key, value in dictionary.items():
-                    new_dict[key] = _recursive_dict_adapt(value)
-                return new_dict
-            elif isinstance(dictionary, list):
-                new_list = []
-                for value in dictionary:
-                    new_list.append(_recursive_dict_adapt(value))
-                return new_list
-            elif isinstance(dictionary, BaseModel) or isinstance(dictionary, Collection):
-                return dictionary.to_json()
-            else:
-                return dictionary
-
         body = self.body
         errors = self.errors
         if self.type in ['json']:
@@ -471,14 +734,11 @@ class BadResponse(Response):
                     status = "SUCCESS"
                 else:
                     status = "FAIL"
-                body = _recursive_dict_adapt(body)
-                errors = _recursive_dict_adapt(errors)
-                body = json.dumps({
+                body = codec.dumps({
                     "status": status,
                     "body": body,
                     "errors": errors,
-                }, cls=ObjectJSONEncoder)
-                body = codecs.encode(body, encoding='utf-8')
+                })
             except ValueError as e:
                 traceback.print_stack()
                 raise Exception(500, e)
@@ -533,7 +793,30 @@ class MakeResponse:
 
     @property
     def body(self):
-        return self.response.make_body()
+        return self.response.content
+
+    @property
+    def file(self):
+        return self.response.file_path
+
+    def open_file(self):
+        return self.response.open_file()
+
+    @property
+    def status(self):
+        return self.response.status
+
+    @property
+    def is_stream(self):
+        return self.response.is_stream
+
+    @property
+    def etag(self):
+        return self.response.etag
+
+    @property
+    def auto_etag(self):
+        return self.response.auto_etag
 
     @property
     def http_status(self):
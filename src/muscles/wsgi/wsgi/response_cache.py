@@ -0,0 +1,207 @@
+import hashlib
+import os
+import threading
+import time
+
+from .cache import LRUCache
+from .response import CachedResponse
+
+
+class _Flight:
+    """
+    Запрос, формирующий ответ для ключа кэша. Остальные запросы с тем же ключом ждут его результат
+    """
+
+    __slots__ = ('event', 'response')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+
+
+class Cache:
+    """
+    Кэш ответов маршрута:
+
+        @routes.init('/articles', method='GET', cache=Cache(ttl=30, vary=['Accept-Language']))
+
+    Ключ - ключ маршрута, метод, путь, параметры запроса и значения заголовков vary. Запросы с заголовками
+    private (по умолчанию Authorization и Cookie) обходят кэш, если эти заголовки не указаны в vary.
+    Одновременные промахи по одному ключу выполняют обработчик один раз (singleflight).
+    Сохраняются только успешные ответы без cookie.
+
+    С общим хранилищем (CacheBackend) ответы доступны всем воркерам узла:
+
+        cache=Cache(ttl=30, backend=shared_backend('responses'))
+    """
+
+    def __init__(self, ttl: float = 60, vary: list = None, maxsize: int = 1024, methods=('GET', 'HEAD'),
+                 backend=None, private=('Authorization', 'Cookie'), wait_timeout: float = 30):
+        """
+        Конструктор кэша
+
+        :param ttl: Время жизни ответа в секундах
+        :param vary: Заголовки запроса, от которых зависит ответ
+        :param maxsize: Максимальное количество ответов
+        :param methods: Кэшируемые методы
+        :param backend: Хранилище ответов: с интерфейсом LRUCache (по умолчанию, в памяти процесса)
+            или общее CacheBackend
+        :param private: Заголовки запроса, при наличии которых ответ зависит от пользователя и кэш не используется.
+            Заголовок, указанный в vary, входит в ключ и кэш не отключает
+        :param wait_timeout: Время ожидания ответа, который формирует другой запрос, в секундах. После него
+            обработчик выполняется самостоятельно
+        """
+        self.ttl = ttl
+        self.vary = tuple(vary or ())
+        self.methods = tuple(method.upper() for method in methods)
+        vary_lower = {name.lower() for name in self.vary}
+        self.private = tuple(name for name in private if name.lower() not in vary_lower)
+        self.wait_timeout = wait_timeout
+        self.backend = backend if backend is not None else LRUCache(maxsize)
+        self.shared = getattr(self.backend, 'shared', False)
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, request) -> bool:
+        """
+        Проверяет, что ответ на запрос можно взять из кэша
+
+        :param request: Объект запроса
+        :return: bool
+        """
+        if request.method.upper() not in self.methods:
+            return False
+        headers = request.headers
+        return not any(headers.get(name) for name in self.private)
+
+    def key(self, request) -> tuple:
+        """
+        Формирует ключ ответа
+
+        :param request: Объект запроса
+        :return: tuple
+        """
+        route_key = request.route['key'] if request.route else None
+        return (route_key, request.method.upper(), request.path, tuple(request.raw_query),
+                tuple(request.headers.get(name) for name in self.vary))
+
+    def get(self, key):
+        """
+        Возвращает ответ из кэша, если его время жизни не истекло
+
+        :param key: Ключ ответа
+        :return: CachedResponse или None
+        """
+        if self.shared:
+            data = self.backend.get(self._shared_key(key))
+            if data is None:
+                return None
+            try:
+                return CachedResponse.loads(data)
+            except ValueError:
+                return None
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        expires, response = entry
+        if expires < time.monotonic():
+            self.backend.pop(key)
+            return None
+        return response
+
+    def set(self, key, response: CachedResponse):
+        """
+        Сохраняет ответ
+
+        :param key: Ключ ответа
+        :param response: Готовый ответ
+        :return:
+        """
+        if self.shared:
+            self.backend.set(self._shared_key(key), response.dumps(), self.ttl)
+            return
+        self.backend.set(key, (time.monotonic() + self.ttl, response))
+
+    @staticmethod
+    def _generation_key(route_key) -> str:
+        return 'muscles:generation:%r' % (route_key,)
+
+    def _shared_key(self, key) -> str:
+        """
+        Ключ общего хранилища: хэш ключа ответа и поколения маршрута. Смена поколения при invalidate
+        делает недоступными прежние ответы маршрута во всех воркерах, они удаляются по времени жизни
+
+        :param key: Ключ ответа
+        :return: str
+        """
+        generation = self.backend.peek(self._generation_key(key[0]))
+        digest = hashlib.blake2b(repr((generation, key)).encode('utf-8'), digest_size=16).hexdigest()
+        return 'muscles:response:%s' % digest
+
+    def fetch(self, key, build):
+        """
+        Возвращает ответ из кэша или формирует его. Если ответ для ключа уже формируется другим запросом,
+        ожидает его результат
+
+        :param key: Ключ ответа
+        :param build: Функция формирования ответа
+        :return: Объект ответа
+        """
+        response = self.get(key)
+        if response is not None:
+            return response
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if not flight.event.wait(self.wait_timeout):
+                return build()
+            if flight.response is not None:
+                self.coalesced += 1
+                return flight.response
+            return build()
+        try:
+            response = build()
+            frozen = CachedResponse.freeze(response)
+            if frozen is not None:
+                self.set(key, frozen)
+                flight.response = frozen
+                return frozen
+            return response
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, route_key=None) -> int:
+        """
+        Удаляет ответы маршрута или все ответы
+
+        :param route_key: Ключ маршрута, None - все ответы (для общего хранилища - все ответы хранилища)
+        :return: Количество удаленных ответов, для общего хранилища 0 - количество неизвестно
+        """
+        if self.shared:
+            if route_key is None:
+                self.backend.clear()
+            else:
+                token = ('%d-%d' % (os.getpid(), time.time_ns())).encode('ascii')
+                self.backend.set(self._generation_key(route_key), token, self.ttl)
+            return 0
+        if route_key is None:
+            count = len(self.backend)
+            self.backend.clear()
+            return count
+        return self.backend.pop_matching(lambda key: key[0] == route_key)
+
+    def stats(self) -> dict:
+        """
+        Статистика кэша
+
+        :return: dict
+        """
+        stats = self.backend.stats()
+        stats['coalesced'] = self.coalesced
+        return stats
@@ -7,8 +7,11 @@ from .response import Response
 from muscles.core import Schema
 from muscles.core import BaseSecurity
 from muscles.core import GuestUser
-from muscles.core import Itinerary
+from muscles.core import Itinerary as BaseItinerary
 from .error_handler import ForbiddenException
+from .matcher import RouteMatcher, RouterIndex
+from .cache import LRUCache, FileCache
+from . import files
 
 
 class RouteRule(ABC):
@@ -20,6 +23,15 @@ class RouteRule(ABC):
     def is_match(self, match, chunk):
         pass
 
+    def matcher(self, route):
+        """
+        Возвращает проверку части пути для скомпилированного дерева маршрутов
+
+        :param route: Адрес узла
+        :return: callable
+        """
+        return lambda val: self.is_match(val, route)
+
     def compile(self, val):
         return str(val)
 
@@ -50,9 +62,13 @@ class RouteRuleVar(RouteRule):
     Правил обработки роута - разрешенные символы
     """
     name = 'var'
+    pattern = re.compile(r"^([\w\d\%\_\-]+)$")
 
     def is_match(self, val, chunk):
-        return True if re.search(r"^([\w\d\%\_\-]+)$", val) else False
+        return True if self.pattern.search(val) else False
+
+    def matcher(self, route):
+        return self.pattern.search
 
     def param(self, val):
         return str(val)
@@ -66,9 +82,13 @@ class RouteRuleInt(RouteRule):
     Правил обработки роута - цифры
     """
     name = 'int'
+    pattern = re.compile(r"^([\d]+)$")
 
     def is_match(self, val, chunk):
-        return True if re.search(r"^([\d]+)$", val) else False
+        return True if self.pattern.search(val) else False
+
+    def matcher(self, route):
+        return self.pattern.search
 
     def param(self, val):
         return int(val)
@@ -82,9 +102,13 @@ class RouteRuleFloat(RouteRule):
     Правил обработки роута - цифра с плавающей точкой
     """
     name = 'float'
+    pattern = re.compile(r"^([\d]+\.[\d]+)$")
 
     def is_match(self, val, chunk):
-        return True if re.search(r"^([\d]+\.[\d]+)$", val) else False
+        return True if self.pattern.search(val) else False
+
+    def matcher(self, route):
+        return self.pattern.search
 
     def param(self, val):
         return float(val)
@@ -650,6 +674,444 @@ class Itinerary1:
         tree(self.node, 0)
 
 
+class Itinerary(BaseItinerary):
+    """
+    Роутер с предкомпилированным деревом маршрутов
+    """
+
+    _matcher = None
+    _dispatch = None
+    _url_builders = None
+    url_param_pattern = re.compile(r"\{([\w\d\%\_\-]+)\:?([\w\d\%\_\-]+)?\}")
+    _generation = 0
+    _router_index = None
+    _static_index = None
+    _static_default = None
+    _static_depth = 0
+    static_sidecars_size = 4096
+    route_cache = None
+
+    def add(self, route, key=None, handler=None, method=None, content_type=None,
+            redirect: str = None, module=None):
+        """
+        Добавляет функцию обработки маршрута и сбрасывает скомпилированное дерево маршрутов
+
+        :param route: Маршрут
+        :param key: Ключ маршрута
+        :param handler: Обработчик маршрута
+        :param method: Метод маршрута
+        :param content_type: Тип контента маршрута
+        :param redirect: Редирект для маршрута
+        :param module: Настройки модуля обработки
+        :return:
+        """
+        start = len(self.nodes_map)
+        handler = super().add(route, key=key, handler=handler, method=method, content_type=content_type,
+                              redirect=redirect, module=module)
+        if self._dispatch is None:
+            self._dispatch = {}
+        if self._url_builders is None:
+            self._url_builders = {}
+        for position in range(start, len(self.nodes_map)):
+            self._add_dispatch(position, self.nodes_map[position], handler.node)
+            self._add_url_builder(self.nodes_map[position])
+        self.invalidate()
+        return handler
+
+    def _add_url_builder(self, route):
+        """
+        Компилирует маршрут в построитель ссылки: список (текст, параметр, правило, имя правила) и завершающий
+        текст.
+        Для ключа используется первый зарегистрированный маршрут
+
+        :param route: Маршрут
+        :return:
+        """
+        if route['key'] in self._url_builders:
+            return
+        rules = {}
+        for rule in self.rules:
+            rules.setdefault(rule.name, rule)
+        parts = []
+        literal = []
+        for i, chunk in enumerate(route['route'].split('/')):
+            if i > 0:
+                literal.append('/')
+            pieces = self.url_param_pattern.split(chunk)
+            for j in range(0, len(pieces) - 1, 3):
+                literal.append(pieces[j])
+                name = pieces[j + 2] if pieces[j + 2] else 'var'
+                parts.append((''.join(literal), pieces[j + 1], rules.get(name), name))
+                literal = []
+            literal.append(pieces[-1])
+        self._url_builders[route['key']] = (tuple(parts), ''.join(literal))
+
+    def _compile_urls(self):
+        """
+        Перекомпилирует построители ссылок всех маршрутов роутера
+
+        :return:
+        """
+        self._url_builders = {}
+        for route in self.nodes_map:
+            self._add_url_builder(route)
+
+    def to_url(self, route_key, params):
+        """
+        Формирует из ключа маршрута и параметров ссылку
+
+        :param route_key: Ключ маршрута
+        :param params: Параметры
+        :return:
+        """
+        builder = self._url_builders.get(route_key) if self._url_builders else None
+        if builder is None:
+            return ''
+        url = []
+        for literal, param, rule, name in builder[0]:
+            if rule is None:
+                raise Exception('Route rule `%s` not found' % name)
+            url.append(literal)
+            url.append(rule.compile(params.get(param, '')))
+        url.append(builder[1])
+        return ''.join(url)
+
+    def to_urls(self, route_key, params_list):
+        """
+        Формирует ссылки для одного ключа маршрута и списка параметров
+
+        :param route_key: Ключ маршрута
+        :param params_list: Список параметров
+        :return: list
+        """
+        return [self.to_url(route_key, params) for params in params_list]
+
+    def add_rule(self, rule):
+        """
+        Добавляет новое правило в доступный список правил. Правила общие для всех роутеров, поэтому сбрасываются
+        кэши всех роутеров
+
+        :param rule: Объект правила
+        :return:
+        """
+        super().add_rule(rule)
+        for key, instance in self.instance_list():
+            if isinstance(instance, Itinerary):
+                if instance._url_builders is not None:
+                    instance._compile_urls()
+                instance.invalidate()
+
+    def add_static(self, directory: str, prefix: str = None, handler=None, full_path: bool = False,
+                   max_age: int = None, immutable: bool = False, cache_control: str = None,
+                   precompressed: bool = False, file_cache: int = None):
+        """
+        Функции обработки статических файлов
+
+        :param directory: Директория фалов
+        :param prefix: Префикc для маршрута
+        :param handler: Обработчик маршрута
+        :param bool full_path: Польный путь маршрута
+        :param max_age: Время кэширования файлов клиентом в секундах
+        :param immutable: Файлы никогда не меняются по своему адресу (fingerprinted), не требуют перепроверки
+        :param cache_control: Значение заголовка Cache-Control, заменяет max_age и immutable
+        :param precompressed: Отдавать заранее сжатые файлы (app.js.br, app.js.gz) по заголовку Accept-Encoding
+        :param file_cache: Размер кэша содержимого файлов в памяти в байтах, None - файлы читаются с диска
+        :return:
+        """
+        super().add_static(directory, prefix=prefix, handler=handler, full_path=full_path)
+        self.static_map[-1]['cache_control'] = cache_control or files.cache_control(max_age=max_age,
+                                                                                    immutable=immutable)
+        self.static_map[-1]['sidecars'] = LRUCache(self.static_sidecars_size) if precompressed else None
+        self.static_map[-1]['files'] = FileCache(file_cache) if file_cache else None
+        self._compile_static()
+        self.invalidate()
+
+    def static_stats(self) -> dict:
+        """
+        Статистика кэшей файлов статических директорий
+
+        :return: dict префикс => статистика
+        """
+        return {static['prefix']: static['files'].stats() for static in self.static_map
+                if static.get('files') is not None}
+
+    def static(self, directory: str, prefix: str = None, full_path: bool = False, **kwargs):
+        """
+        Декторатор функции обработки статических файлов
+
+        :param directory: Директория фалов
+        :param prefix: Префикc для маршрута
+        :param bool full_path: Польный путь маршрута
+        :param kwargs: Настройки кэширования, см. add_static
+        :return:
+        """
+
+        def decorator(func):
+            self.add_static(directory, prefix=prefix, handler=func, full_path=full_path, **kwargs)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return func(*args, **kwargs)
+
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+
+        return decorator
+
+    def _compile_static(self):
+        """
+        Строит индекс статических директорий по префиксу с завершающим `/`: префикс => (позиция, директория).
+        Директория без префикса подходит для любого пути
+
+        :return:
+        """
+        index = {}
+        default = None
+        for position, static in enumerate(self.static_map):
+            if static['prefix']:
+                index.setdefault(static['prefix'] + '/', (position, static))
+            elif default is None:
+                default = (position, static)
+        self._static_index = index
+        self._static_default = default
+        self._static_depth = max([key.count('/') for key in index] or [0])
+
+    def get_current_static(self, request):
+        """
+        Возвращает обработчик статических файлов. Из подходящих префиксов выбирается директория, добавленная
+        первой, как при последовательной проверке static_map
+
+        :param request: Объект запроса
+        :return:
+        """
+        found = self._static_default
+        if not self._static_index or (found is not None and found[0] == 0):
+            return found[1] if found is not None else None
+        index = self._static_index
+        path = request.path.lower()
+        depth = 0
+        position = path.find('/')
+        while position != -1 and depth < self._static_depth:
+            static = index.get(path[:position + 1])
+            if static is not None and (found is None or static[0] < found[0]):
+                found = static
+            depth += 1
+            position = path.find('/', position + 1)
+        return found[1] if found is not None else None
+
+    def invalidate(self):
+        """
+        Сбрасывает скомпилированное дерево маршрутов, общий индекс роутеров и кэш найденных маршрутов
+
+        :return:
+        """
+        self._matcher = None
+        Itinerary._generation += 1
+        if self.route_cache is not None:
+            self.route_cache.clear()
+
+    def _trigger_set_handler(self, handler, *args, cache=None, **kwargs):
+        """
+        Сохраняет настройки кэша ответов обработчика
+
+        :param handler: Обработчик маршрута
+        :param cache: Кэш ответов маршрута, объект Cache
+        :return:
+        """
+        handler = super()._trigger_set_handler(handler, *args, **kwargs)
+        if cache is not None:
+            handler.cache = cache
+        return handler
+
+    def invalidate_cache(self, route_key=None) -> int:
+        """
+        Удаляет ответы маршрута из кэшей ответов роутера
+
+        :param route_key: Ключ маршрута, None - все маршруты роутера
+        :return: Количество удаленных ответов
+        """
+        count = 0
+        caches = {}
+        for route in self.nodes_map:
+            cache = getattr(route['handler'], 'cache', None)
+            if cache is not None and (route_key is None or route['key'] == route_key):
+                caches.setdefault(id(cache), (cache, set()))[1].add(route['key'])
+        for cache, keys in caches.values():
+            for key in keys:
+                count += cache.invalidate(key)
+        return count
+
+    def enable_route_cache(self, maxsize: int = 1024):
+        """
+        Включает кэш найденных маршрутов по (метод, путь, тип контента)
+
+        :param maxsize: Максимальное количество записей кэша
+        :return: LRUCache
+        """
+        self.route_cache = LRUCache(maxsize)
+        return self.route_cache
+
+    def disable_route_cache(self):
+        """
+        Выключает кэш найденных маршрутов
+
+        :return:
+        """
+        self.route_cache = None
+
+    def _add_dispatch(self, position, route, node):
+        """
+        Добавляет маршрут в таблицу диспетчеризации {узел: {METHOD: {content_type: (позиция, маршрут)}}}.
+        Таблица строится по узлу, а не по ключу: на одном пути могут быть маршруты с разными ключами,
+        например GET users.list и POST users.create
+
+        :param position: Позиция маршрута в nodes_map
+        :param route: Маршрут
+        :param node: Узел дерева маршрутов
+        :return:
+        """
+        method = route['method'].upper() if route['method'] and route['method'] != '*' else '*'
+        content_type = route['content_type'].lower() \
+            if route['content_type'] and route['content_type'] != '*/*' else '*/*'
+        methods = self._dispatch.setdefault(node, {})
+        methods.setdefault(method, {}).setdefault(content_type, (position, route))
+
+    def dispatch(self, node, method, content_type):
+        """
+        Находит маршрут узла по методу и типу контента запроса
+
+        :param node: Узел дерева маршрутов
+        :param method: Метод запроса
+        :param content_type: Тип контента запроса
+        :return: dict или None
+        """
+        if not self._dispatch:
+            return None
+        methods = self._dispatch.get(node)
+        if not methods:
+            return None
+        method = (method or '').upper()
+        content_type = (content_type or '').lower()
+        found = None
+        for _method in (method, '*'):
+            content_types = methods.get(_method)
+            if not content_types:
+                continue
+            for _content_type in (content_type, '*/*'):
+                item = content_types.get(_content_type)
+                if item is not None and (found is None or item[0] < found[0]):
+                    found = item
+        return found[1] if found is not None else None
+
+    def allowed_methods(self, url):
+        """
+        Возвращает список разрешенных методов для УРЛ, например для ответов 405 и заголовка Allow
+
+        :param url: УРЛ
+        :return: list или None, если маршрут не найден
+        """
+        node = self.match(url)
+        if node is None or not self._dispatch:
+            return None
+        methods = set(self._dispatch.get(node, {}).keys())
+        if '*' in methods:
+            return [method.upper() for method in self.legal_http_method]
+        return sorted(methods)
+
+    def compile(self):
+        """
+        Компилирует дерево маршрутов. Вызывается автоматически при первом поиске после регистрации маршрутов
+
+        :return: RouteMatcher
+        """
+        self._matcher = RouteMatcher(self.node, [item['key'] for item in self.nodes_map],
+                                     is_static=lambda rule: isinstance(rule, RouteRuleDefault))
+        return self._matcher
+
+    def match(self, url):
+        """
+        Находит подходящий маршрут по УРЛ
+
+        :param url: Ссылка
+        :return:
+        """
+        if url == '/':
+            url = '/main'
+        chunks = [chunk for chunk in url.split('/') if chunk]
+        matcher = self._matcher if self._matcher is not None else self.compile()
+        return matcher.match(chunks)
+
+    def first_segments(self):
+        """
+        Возвращает множество статических первых частей путей роутера или None, если роутер может обработать
+        любой путь
+
+        :return: set или None
+        """
+        segments = set()
+        for node in self.node.childrens:
+            if not isinstance(node.rule, RouteRuleDefault):
+                return None
+            segments.add(node.route)
+        return segments
+
+    def router_index(self):
+        """
+        Возвращает общий индекс всех роутеров, перестраивает его после добавления маршрутов или роутеров
+
+        :return: RouterIndex
+        """
+        state = (Itinerary._generation, len(self._instances))
+        index = Itinerary._router_index
+        if index is None or index[0] != state:
+            instances = [instance for key, instance in self.instance_list()]
+            index = (state, RouterIndex(instances, lambda instance: instance.first_segments()
+                                        if isinstance(instance, Itinerary) else None))
+            Itinerary._router_index = index
+        return index[1]
+
+    def resolve(self, request):
+        """
+        Находит роутер и маршрут запроса среди всех роутеров по общему индексу
+
+        :param request: Объект запроса
+        :return: (роутер, маршрут, параметры)
+        """
+        dictionary = ()
+        for instance in self.router_index().candidates(request.path):
+            call, dictionary = instance.get_current_route(request)
+            if call:
+                return instance, call, dictionary
+        return None, None, dictionary
+
+    def get_current_route(self, request):
+        """
+        Получает маршрут из объекта запроса по таблице диспетчеризации. Если включен кэш маршрутов, найденный
+        маршрут и параметры пути берутся из кэша
+
+        :param request: Объект запроса
+        :return:
+        """
+        cache = self.route_cache
+        if cache is not None:
+            cache_key = (request.method, request.path, request.content_type)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                route, dictionary = cached
+                return route, dictionary.copy() if dictionary else dictionary
+
+        node, dictionary = self.match_with_params(request.path)
+        if node is None:
+            route, dictionary = None, ()
+        else:
+            route = self.dispatch(node, request.method, request.content_type)
+
+        if cache is not None:
+            cache.set(cache_key, (route, dictionary.copy() if dictionary else dictionary))
+        return route, dictionary
+
+
 class Node(ABC):
     """
     Класс узла роутера
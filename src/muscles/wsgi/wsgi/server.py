@@ -1,19 +1,27 @@
 import os
 import io
+import uuid
 import traceback
 
 from muscles.core import NotFoundException, ApplicationException, ErrorException
 from muscles.core import AttributeErrorException
 from muscles.core import inject, EventsStorageInterface
 from .request import RequestMaker
-from .response import MakeResponse, BaseResponse
+from .error_handler import ApplicationException as WsgiApplicationException
+from .response import MakeResponse, BaseResponse, CachedFileResponse, StreamingResponse
+from .streaming import is_stream
+from .conditional import body_etag, version_etag
 from .routers import routes, itinerary
+from .files import FileIterator, MultipartRangeIterator, FILE_CHUNK_SIZE, PRECOMPRESSED_ENCODINGS, file_etag, \
+    http_date, is_not_modified, parse_range, if_range_matches, negotiate_encoding
+from .http_code import code_status
 from urllib.parse import unquote
 
 MAX_LINE = 64 * 1024
 MAX_HEADERS = 100
 TIMEOUT = 2
 MAX_CONNECTIONS = 1000
+BODILESS_STATUSES = ('204', '304')
 
 
 class Transport:
@@ -22,6 +30,10 @@ class Transport:
     """
 
     server = None
+    #: Сжатие ответов на лету, см. Compression
+    compression = None
+    #: Формировать ETag по телу всех ответов на GET и HEAD
+    auto_etag = False
 
     def __init__(self):
         pass
@@ -35,6 +47,15 @@ class Transport:
     def make_request(self):
         pass
 
+    def make_file(self, fp, length=None):
+        """
+        Формирует тело ответа из открытого файла
+        :param fp: Открытый файл
+        :param length: Размер файла
+        :return:
+        """
+        return FileIterator(fp, length)
+
 
 class WsgiTransport(Transport):
     """
@@ -78,15 +99,148 @@ class WsgiTransport(Transport):
             print("HTTP make_response:", response)
             print("HTTP STATUS:", response.http_status)
             print("HTTP HEADERS:", response.headers)
-            print("HTTP BODY:", response.body)
-            self.send_header(response.http_status, response.headers)
-            body = response.body if isinstance(response.body, list) else [response.body]
-            return body
+            if response.is_stream:
+                return self.make_stream_response(response)
+            if response.status in BODILESS_STATUSES:
+                self.send_header(response.http_status, response.headers)
+                return []
+            if response.file is not None:
+                return self.make_file_response(response)
+            body = response.body
+            print("HTTP BODY:", body)
+            headers = response.headers
+            if response.status == '200' and self.environ.get('REQUEST_METHOD', 'GET').upper() in ('GET', 'HEAD'):
+                etag = self.response_etag(response, headers, body)
+                if etag is not None:
+                    headers = [header for header in headers if header[0] != 'ETag'] + [('ETag', etag)]
+                    if is_not_modified({'If-None-Match': self.environ.get('HTTP_IF_NONE_MATCH')}, etag=etag):
+                        if self.compression is not None:
+                            # ETag и Vary совпадают с ответом 200, который был бы сжат
+                            headers = self.compression.not_modified_headers(self.environ, response.status,
+                                                                            headers, body)
+                        else:
+                            headers = [header for header in headers
+                                       if header[0] not in ('Content-Length', 'Content-Type')]
+                        self.send_header(self.status_line(304), headers)
+                        return []
+            if self.compression is not None:
+                headers, body = self.compression.apply(self.environ, response.status, headers, body)
+            self.send_header(response.http_status, headers)
+            return body if isinstance(body, list) else [body]
         except Exception as ae:
             print(ae)
             print(traceback.format_exc())
             raise ApplicationException(status=500, reason=ae, body=traceback.format_exc())
 
+    def response_etag(self, response: MakeResponse, headers, body):
+        """
+        Возвращает ETag ответа: заданный заголовком, токеном версии обработчика или по готовому телу ответа
+        :param response: объект ответа
+        :param headers: Заголовки ответа
+        :param body: Готовое тело ответа
+        :return: str или None
+        """
+        etag = next((value for name, value in headers if name == 'ETag'), None) or response.etag
+        if etag is None and (response.auto_etag or self.auto_etag) and isinstance(body, bytes):
+            etag = body_etag(body)
+        return etag
+
+    def make_stream_response(self, response: MakeResponse):
+        """
+        Отправляем потоковый ответ: итератор частей передается WSGI серверу без сборки в памяти
+        :param response: объект потокового ответа
+        :return:
+        """
+        body = response.body
+        try:
+            headers = response.headers
+            if self.compression is not None:
+                headers, body = self.compression.apply_stream(self.environ, response.status, headers, body)
+            self.send_header(response.http_status, headers)
+        except Exception:
+            body.close()
+            raise
+        if response.status in BODILESS_STATUSES or self.environ.get('REQUEST_METHOD', 'GET').upper() == 'HEAD':
+            body.close()
+            return []
+        return body
+
+    def make_file_response(self, response: MakeResponse):
+        """
+        Отправляем файл ответа с поддержкой запросов диапазонов (Range, If-Range)
+        :param response: объект ответа с файлом
+        :return:
+        """
+        fp, stat = response.open_file()
+        try:
+            size = stat.st_size
+            headers = response.headers + [('Accept-Ranges', 'bytes')]
+            method = self.environ.get('REQUEST_METHOD', 'GET').upper()
+
+            ranges = None
+            if method in ('GET', 'HEAD') and response.status == '200':
+                etag = next((value for name, value in headers if name == 'ETag'), None) or file_etag(stat)
+                if if_range_matches(self.environ.get('HTTP_IF_RANGE'), etag=etag, mtime=stat.st_mtime):
+                    ranges = parse_range(self.environ.get('HTTP_RANGE'), size)
+
+            if ranges is None:
+                self.send_header(response.http_status, headers)
+                body = self.make_file(fp, size)
+            elif len(ranges) == 0:
+                fp.close()
+                headers = [header for header in headers if header[0] != 'Content-Length']
+                headers += [('Content-Range', 'bytes */%d' % size), ('Content-Length', '0')]
+                self.send_header(self.status_line(416), headers)
+                return []
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                headers = [header for header in headers if header[0] != 'Content-Length']
+                headers += [('Content-Range', 'bytes %d-%d/%d' % (start, end, size)),
+                            ('Content-Length', str(end - start + 1))]
+                self.send_header(self.status_line(206), headers)
+                fp.seek(start)
+                body = FileIterator(fp, end - start + 1)
+            else:
+                content_type = next((value for name, value in headers if name == 'Content-Type'),
+                                    'application/octet-stream')
+                body = MultipartRangeIterator(fp, ranges, size, content_type, uuid.uuid4().hex)
+                headers = [header for header in headers if header[0] not in ('Content-Length', 'Content-Type')]
+                headers += [('Content-Type', 'multipart/byteranges; boundary=%s' % body.boundary),
+                            ('Content-Length', str(body.content_length))]
+                self.send_header(self.status_line(206), headers)
+        except Exception:
+            fp.close()
+            raise
+
+        if method == 'HEAD':
+            fp.close()
+            return []
+        return body
+
+    @staticmethod
+    def status_line(status):
+        """
+        Формирует HTTP статус по коду
+        :param status: HTTP Код статуса ответа
+        :return: string
+        """
+        return '%s %s' % (status, code_status[str(status)]['message'])
+
+    def make_file(self, fp, length=None):
+        """
+        Формирует тело ответа из открытого файла. Если uWSGI предоставляет wsgi.file_wrapper, файл отдается через
+        него (sendfile), иначе читается блоками. Файл из памяти отдается одним блоком
+        :param fp: Открытый файл
+        :param length: Размер файла
+        :return:
+        """
+        if isinstance(fp, io.BytesIO):
+            return [fp.getvalue()]
+        file_wrapper = self.environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(fp, FILE_CHUNK_SIZE)
+        return FileIterator(fp, length)
+
     def send_header(self, http_status, headers):
         """
         Передаем заголовки ответа
@@ -263,15 +417,21 @@ class WsgiServer:
         self.__transport = self.__transport_class()
         self.__transport.init_server(self)
 
-    def init_transport(self, transport):
+    def init_transport(self, transport, compression=None, auto_etag: bool = None):
         """
         Инициализируем транспортный протокол
         :param transport: Транспорт
+        :param compression: Сжатие ответов на лету, см. Compression
+        :param auto_etag: Формировать ETag по телу всех ответов на GET и HEAD
         :return:
         """
         self.__transport_class = transport
         self.__transport = transport()
         self.__transport.init_server(self)
+        if compression is not None:
+            self.__transport.compression = compression
+        if auto_etag is not None:
+            self.__transport.auto_etag = auto_etag
 
     def execute(self, *args, **kwargs):
         """
@@ -321,21 +481,25 @@ class WsgiServer:
                             resp = BaseResponse(status=200, body=resp)
                         return self.__transport.make_response(resp)
 
-            for key, instance in itinerary.instance_list():
-                call, dictionary = instance.get_current_route(request)
-                if call:
-                    request.route = call
-                    request.itinerary = instance
-                    if 'instance' in call.keys():
-                        for func in call['instance'].get_event('before_request'):
-                            func(request)
-                    break
+            instance, call, dictionary = itinerary.resolve(request)
+            if call:
+                request.route = call
+                request.itinerary = instance
+                if 'instance' in call.keys():
+                    for func in call['instance'].get_event('before_request'):
+                        func(request)
 
         except ErrorException as ae:
             traceback.print_stack()
             print(ae)
             ae.body = traceback.format_exc()
             return self.send_error(ae, request)
+        except WsgiApplicationException as ae:
+            # Ошибки разбора тела запроса в before_request отправляются со своим статусом (400, 413)
+            traceback.print_stack()
+            print(ae)
+            ae.body = traceback.format_exc().splitlines()
+            return self.send_error(ae, request)
         except ImportError as ae:
             traceback.print_stack()
             print(ae)
@@ -357,41 +521,20 @@ class WsgiServer:
                 resp = BaseResponse.redirect(request.route['redirect'])
             else:
                 try:
-                    if hasattr(request.route['handler'], 'controller'):
-                        resp = request.route['handler'](request.route['handler'].controller(), request=request,
-                                                        **dictionary)
-                    else:
-                        resp = request.route['handler'](request=request, **dictionary)
-                    if not isinstance(resp, BaseResponse) and isinstance(resp, str):
-                        resp = BaseResponse(status=200, body=resp, request=request)
-                    elif not isinstance(resp, BaseResponse) and isinstance(resp, bytes):
-                        resp = BaseResponse(status=200, body=resp, request=request)
-                    elif not isinstance(resp, BaseResponse) and isinstance(resp, dict):
-                        resp = BaseResponse(status=200, body=resp, request=request)
-                    elif not isinstance(resp, BaseResponse) and isinstance(resp, tuple):
-                        kwargs = {}
-                        status = 200
-                        if len(resp) >= 0:
-                            kwargs['body'] = resp[0]
-                        if len(resp) >= 1:
-                            status = resp[1]
-                        if len(resp) >= 2:
-                            kwargs['headers'] = resp[2]
-                        resp = BaseResponse(status=status, request=request, **kwargs)
-                    elif not isinstance(resp, BaseResponse):
-                        resp = BaseResponse(status=200, body=resp, request=request)
-
-                    if hasattr(request.itinerary, 'modify_response'):
-                        resp = request.itinerary.modify_response(resp)
-
-                    headers = []
-                    for header in resp.headers:
-                        headers.append('%s: %s' % (header[0], header[1]))
+                    etag = None
+                    version = getattr(request.route['handler'], 'version', None)
+                    if version is not None and request.method.upper() in ('GET', 'HEAD'):
+                        etag = version_etag(version(request, **dictionary))
+                        if etag is not None and is_not_modified(request.headers, etag=etag):
+                            return self.__transport.make_response(BaseResponse.not_modified(headers=[('ETag', etag)]))
 
                     before_response = evnetStorage.get('before_response')
-                    if before_response:
-                        for handler in before_response:
-                            resp = handler(resp)
+                    cache = getattr(request.route['handler'], 'cache', None)
+                    if cache is not None and cache.is_cacheable(request):
+                        resp = cache.fetch(cache.key(request),
+                                           lambda: self.call_handler(request, dictionary, etag, before_response))
+                    else:
+                        resp = self.call_handler(request, dictionary, etag, before_response)
                     return self.__transport.make_response(resp)
                 except ApplicationException as ae:
                     traceback.print_stack()
@@ -403,6 +546,12 @@ class WsgiServer:
                     print(ae)
                     ae.body = traceback.format_exc().splitlines()
                     return self.send_error(ae, request)
+                except WsgiApplicationException as ae:
+                    # Ошибки разбора тела запроса (400) и ограничений multipart (413) отправляются со своим статусом
+                    traceback.print_stack()
+                    print(ae)
+                    ae.body = traceback.format_exc().splitlines()
+                    return self.send_error(ae, request)
                 except ImportError as ae:
                     traceback.print_stack()
                     print(ae)
@@ -420,6 +569,54 @@ class WsgiServer:
                     return self.send_error(ae, request)
         return self.send_error(NotFoundException(status=404, reason="Not Found"), request)
 
+    def call_handler(self, request, dictionary, etag=None, before_response=None):
+        """
+        Вызывает обработчик маршрута и приводит результат к объекту ответа
+        :param request: Объект запроса
+        :param dictionary: Параметры маршрута
+        :param etag: ETag версии ресурса
+        :param before_response: Обработчики события before_response
+        :return: BaseResponse
+        """
+        if hasattr(request.route['handler'], 'controller'):
+            resp = request.route['handler'](request.route['handler'].controller(), request=request,
+                                            **dictionary)
+        else:
+            resp = request.route['handler'](request=request, **dictionary)
+        if not isinstance(resp, BaseResponse) and isinstance(resp, str):
+            resp = BaseResponse(status=200, body=resp, request=request)
+        elif not isinstance(resp, BaseResponse) and isinstance(resp, bytes):
+            resp = BaseResponse(status=200, body=resp, request=request)
+        elif not isinstance(resp, BaseResponse) and isinstance(resp, dict):
+            resp = BaseResponse(status=200, body=resp, request=request)
+        elif not isinstance(resp, BaseResponse) and isinstance(resp, tuple):
+            kwargs = {}
+            status = 200
+            if len(resp) >= 0:
+                kwargs['body'] = resp[0]
+            if len(resp) >= 1:
+                status = resp[1]
+            if len(resp) >= 2:
+                kwargs['headers'] = resp[2]
+            resp = BaseResponse(status=status, request=request, **kwargs)
+        elif not isinstance(resp, BaseResponse) and is_stream(resp):
+            resp = StreamingResponse(resp, status=200, request=request)
+        elif not isinstance(resp, BaseResponse):
+            resp = BaseResponse(status=200, body=resp, request=request)
+
+        if etag is not None:
+            resp.etag = etag
+        if getattr(request.route['handler'], 'auto_etag', False):
+            resp.auto_etag = True
+
+        if hasattr(request.itinerary, 'modify_response'):
+            resp = request.itinerary.modify_response(resp)
+
+        if before_response:
+            for handler in before_response:
+                resp = handler(resp)
+        return resp
+
     def handle_static(self, static, request):
         """
         Обработчик статических файлов
@@ -433,21 +630,58 @@ class WsgiServer:
         if not os.path.isfile(resp_file):
             raise NotFoundException(status=404, reason='Not found')
         try:
-            resp = BaseResponse(status=200, file=resp_file)
+            headers = []
+            if static.get('sidecars') is not None:
+                headers.append(('Vary', 'Accept-Encoding'))
+                resp_file = self.precompressed_file(static['sidecars'], resp_file,
+                                                    request.headers.get('Accept-Encoding'))
+
+            cached = static['files'].get(resp_file) if static.get('files') is not None else None
+            if cached is not None:
+                stat, etag, last_modified = cached.stat, cached.etag, cached.last_modified
+            else:
+                stat = os.stat(resp_file)
+                etag, last_modified = file_etag(stat), http_date(stat.st_mtime)
+            headers += [('ETag', etag), ('Last-Modified', last_modified)]
+            if static.get('cache_control'):
+                headers.append(('Cache-Control', static['cache_control']))
+
+            if request.method in ('GET', 'HEAD') and \
+                    is_not_modified(request.headers, etag=etag, mtime=stat.st_mtime):
+                return self.__transport.make_response(BaseResponse.not_modified(headers=headers))
+
+            if cached is not None:
+                resp = CachedFileResponse(cached, status=200, headers=headers)
+            else:
+                resp = BaseResponse(status=200, file=resp_file, headers=headers)
 
             if static['handler'] is not None:
                 resp = static['handler'](resp)
 
-            headers = []
-            for header in resp.headers:
-                headers.append('%s: %s' % (header[0], header[1]))
-
-            self.__transport.send_header(resp.status, resp.headers)
-            with io.open(resp_file, "rb") as f:
-                yield f.read()
+            return self.__transport.make_response(resp)
         except Exception as e:
             raise NotFoundException(status=404, reason='Not found')
 
+    @staticmethod
+    def precompressed_file(sidecars, resp_file, accept_encoding):
+        """
+        Выбирает заранее сжатый файл по заголовку Accept-Encoding. Наличие сжатых файлов проверяется один раз
+        для каждого пути и хранится в кэше директории
+        :param sidecars: Кэш сжатых файлов директории
+        :param resp_file: Путь к исходному файлу
+        :param accept_encoding: Значение заголовка Accept-Encoding
+        :return: Путь к файлу для ответа
+        """
+        available = sidecars.get(resp_file)
+        if available is None:
+            available = tuple((encoding, resp_file + extension) for encoding, extension in PRECOMPRESSED_ENCODINGS
+                              if os.path.isfile(resp_file + extension))
+            sidecars.set(resp_file, available)
+        encoding = negotiate_encoding(accept_encoding, [encoding for encoding, path in available])
+        if encoding is None:
+            return resp_file
+        return dict(available)[encoding]
+
     def send_error(self, err, request=None):
         """
         Отправляет ответ ошибки
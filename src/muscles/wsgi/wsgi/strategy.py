@@ -4,6 +4,7 @@ from muscles.core import BaseStrategy
 from watchdog.events import LoggingEventHandler
 from .server import WsgiTransport, WsgiServer
 from .error_handler import ResponseErrorHandler
+from .codec import set_codec
 
 event_handler = LoggingEventHandler()
 
@@ -19,12 +20,17 @@ class WsgiStrategy(BaseStrategy):
         :param args:
         :param error_handler:
         :param kwargs:
+        :param kwargs[json_codec]: Кодек JSON: orjson, ujson или json, по умолчанию json
+        :param kwargs[compression]: Сжатие ответов на лету, объект Compression
+        :param kwargs[auto_etag]: Формировать ETag и отвечать 304 для всех ответов на GET и HEAD
         :return:
         """
+        if kwargs.get('json_codec'):
+            set_codec(kwargs['json_codec'])
         host = kwargs['host'] if hasattr(kwargs, 'host') else 'localhost'
         port = kwargs['port'] if hasattr(kwargs, 'port') else 8080
 
         server = WsgiServer(host, port, error_handler=error_handler)
         transport = kwargs.get('transport', WsgiTransport)
-        server.init_transport(transport)
+        server.init_transport(transport, compression=kwargs.get('compression'), auto_etag=kwargs.get('auto_etag'))
         return server.execute(*args, **kwargs)
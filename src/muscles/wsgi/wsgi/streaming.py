@@ -0,0 +1,243 @@
+import queue as queue_module
+from types import GeneratorType
+
+from muscles.core import Collection
+
+from . import codec
+
+#: Размер части потокового JSON: мелкие модели собираются в одну часть, чтобы не отправлять их по одной
+JSON_CHUNK_SIZE = 16 * 1024
+#: Комментарий SSE для поддержания соединения, при разрыве соединения его отправка завершает поток
+SSE_HEARTBEAT = b':\n\n'
+#: Интервал комментариев SSE в секундах
+SSE_HEARTBEAT_INTERVAL = 15.0
+#: Признак окончания очереди событий
+STOP_EVENTS = object()
+
+
+def is_stream(obj) -> bool:
+    """
+    Проверяет, что обработчик вернул поток частей ответа: генератор или итератор
+
+    :param obj: Результат обработчика
+    :return: bool
+    """
+    if isinstance(obj, GeneratorType):
+        return True
+    if isinstance(obj, (str, bytes, bytearray, dict, list, tuple)):
+        return False
+    return hasattr(obj, '__next__') and hasattr(obj, '__iter__')
+
+
+class ClosingIterator:
+    """
+    Тело потокового ответа. Отдает части WSGI серверу по мере их получения, строки кодирует в байты.
+    При закрытии закрывает исходный итератор и вызывает обработчики закрытия, даже если один из них упал
+    """
+
+    def __init__(self, iterable, charset: str = 'utf-8', callbacks=None):
+        """
+        Конструктор итератора
+
+        :param iterable: Итерируемый объект с частями ответа
+        :param charset: Кодировка строковых частей
+        :param callbacks: Обработчики закрытия
+        """
+        self.iterable = iterable
+        self.iterator = iter(iterable)
+        self.charset = charset
+        self.callbacks = list(callbacks or [])
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self.iterator)
+        if isinstance(chunk, str):
+            return chunk.encode(self.charset)
+        if isinstance(chunk, bytearray) or isinstance(chunk, memoryview):
+            return bytes(chunk)
+        return chunk
+
+    def close(self):
+        """
+        Вызывается WSGI сервером после отправки ответа или при разрыве соединения
+
+        :return:
+        """
+        if self.closed:
+            return
+        self.closed = True
+        callbacks = self.callbacks
+        if hasattr(self.iterable, 'close'):
+            callbacks = [self.iterable.close] + callbacks
+        self._run(callbacks)
+
+    @classmethod
+    def _run(cls, callbacks):
+        if not callbacks:
+            return
+        try:
+            callbacks[0]()
+        finally:
+            cls._run(callbacks[1:])
+
+
+def _chunked(parts, chunk_size):
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_items(items):
+    """
+    Возвращает итератор моделей: для Collection - по ее дочерним моделям, иначе по самому объекту
+
+    :param items: Collection или любой итерируемый объект моделей
+    :return: итератор
+    """
+    if isinstance(items, Collection):
+        return iter(items._children)
+    return iter(items)
+
+
+def iter_ndjson(items, chunk_size: int = JSON_CHUNK_SIZE):
+    """
+    Сериализует модели по одной в формате NDJSON: один JSON объект на строку.
+    В памяти находится только текущая часть ответа
+
+    :param items: Collection или любой итерируемый объект моделей
+    :param chunk_size: Размер части ответа
+    :return: генератор bytes
+    """
+    dumps = codec.get_codec().dumps
+    return _chunked((dumps(item) + b'\n' for item in iter_items(items)), chunk_size)
+
+
+def iter_json_array(items, envelope: dict = None, key: str = 'data', chunk_size: int = JSON_CHUNK_SIZE):
+    """
+    Сериализует модели по одной в JSON массив. Массив может быть вложен в объект-обертку под ключом key:
+    {"status": "SUCCESS", "data": [...]}
+
+    :param items: Collection или любой итерируемый объект моделей
+    :param envelope: Объект-обертка
+    :param key: Ключ массива в обертке
+    :param chunk_size: Размер части ответа
+    :return: генератор bytes
+    """
+    dumps = codec.get_codec().dumps
+
+    def parts():
+        if envelope is None:
+            yield b'['
+        else:
+            head = dumps(envelope).rstrip()[:-1]
+            yield head + (b',' if envelope else b'') + dumps(key) + b':['
+        separator = b''
+        for item in iter_items(items):
+            yield separator + dumps(item)
+            separator = b','
+        yield b']' if envelope is None else b']}'
+
+    return _chunked(parts(), chunk_size)
+
+
+class ServerSentEvent:
+    """
+    Событие Server-Sent Events
+    """
+
+    __slots__ = ('data', 'event', 'id', 'retry')
+
+    def __init__(self, data=None, event: str = None, id=None, retry: int = None):
+        """
+        Конструктор события
+
+        :param data: Данные: str, bytes или объект, сериализуемый в JSON
+        :param event: Тип события
+        :param id: Идентификатор события, клиент вернет его в заголовке Last-Event-ID при переподключении
+        :param retry: Интервал переподключения клиента в миллисекундах
+        """
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    @staticmethod
+    def _field(value) -> str:
+        return str(value).replace('\r', '').replace('\n', '')
+
+    def encode(self, charset: str = 'utf-8') -> bytes:
+        """
+        Формирует событие в формате text/event-stream
+
+        :param charset: Кодировка
+        :return: bytes
+        """
+        lines = []
+        if self.event is not None:
+            lines.append('event: %s' % self._field(self.event))
+        if self.id is not None:
+            lines.append('id: %s' % self._field(self.id))
+        if self.retry is not None:
+            lines.append('retry: %d' % int(self.retry))
+        if self.data is not None:
+            data = self.data
+            if isinstance(data, bytes):
+                data = data.decode(charset)
+            elif not isinstance(data, str):
+                data = codec.dumps(data).decode('utf-8')
+            lines += ['data: %s' % line for line in data.splitlines() or ['']]
+        return ('\n'.join(lines) + '\n\n').encode(charset)
+
+
+def iter_queue(source, heartbeat: float = SSE_HEARTBEAT_INTERVAL, stop=STOP_EVENTS):
+    """
+    Читает события из очереди. Если за heartbeat секунд событий нет, возвращает None - сигнал отправить
+    комментарий. Ожидание на queue.Queue под gevent (uWSGI --gevent) отдает управление другим запросам,
+    поэтому один воркер держит много подписок
+
+    :param source: Очередь с методом get(timeout=...)
+    :param heartbeat: Интервал комментариев в секундах
+    :param stop: Признак окончания очереди
+    :return: генератор событий
+    """
+    while True:
+        try:
+            item = source.get(timeout=heartbeat)
+        except queue_module.Empty:
+            yield None
+            continue
+        if item is stop:
+            return
+        yield item
+
+
+def iter_events(source, retry: int = None, charset: str = 'utf-8'):
+    """
+    Кодирует события в формат text/event-stream. Каждое событие отдается отдельной частью ответа.
+    None в источнике отправляется как комментарий для поддержания соединения
+
+    :param source: Итерируемый объект событий: ServerSentEvent, данные события или None
+    :param retry: Интервал переподключения клиента в миллисекундах
+    :param charset: Кодировка
+    :return: генератор bytes
+    """
+    if retry is not None:
+        yield ServerSentEvent(retry=retry).encode(charset)
+    for item in source:
+        if item is None:
+            yield SSE_HEARTBEAT
+        elif isinstance(item, ServerSentEvent):
+            yield item.encode(charset)
+        else:
+            yield ServerSentEvent(item).encode(charset)
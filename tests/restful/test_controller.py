@@ -500,3 +500,21 @@ def test_check_drop():
     app = muscular(environ, start_response)
     for pr in app:
         assert pr == b'{"id": "1", "method": "DELETE", "request": {"url": "http://localhost:8080/api/v1/test/1"}}'
+
+
+def test_check_method_not_allowed():
+    """
+    Проверяем, что действие контроллера не вызывается для чужого метода
+    :return:
+    """
+    environ.update({
+        'REQUEST_METHOD': 'PATCH',
+        'REQUEST_URI': '/api/v1/test/1',
+        'PATH_INFO': '/api/v1/test/1',
+        'CONTENT_TYPE': 'application/json',
+    })
+    muscular = Muscular()
+    muscular.context.strategy = WsgiStrategy
+    app = muscular(environ, start_response)
+    for pr in app:
+        assert pr == b'{}'
@@ -0,0 +1,87 @@
+import os
+
+from ...src.muscles.wsgi.wsgi.cache import LRUCache, FileCache
+
+
+def test_lru_eviction():
+    """
+    Проверяем вытеснение давно неиспользуемых записей
+    :return:
+    """
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 0, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_lru_miss():
+    """
+    Проверяем счетчик промахов и очистку кэша
+    :return:
+    """
+    cache = LRUCache(2)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    cache.clear()
+    assert cache.get('a', 0) == 0
+    assert cache.stats()['misses'] == 2
+    assert len(cache) == 0
+
+
+def test_file_cache_hit(tmp_path):
+    """
+    Проверяем чтение файла из памяти и заранее вычисленные заголовки
+    :return:
+    """
+    path = tmp_path / 'style.css'
+    path.write_bytes(b'body{}')
+    cache = FileCache(1024)
+    entry = cache.get(str(path))
+    assert entry.data == b'body{}'
+    assert ('Content-Type', 'text/css') in entry.headers
+    assert ('Content-Length', '6') in entry.headers
+    assert cache.get(str(path)) is entry
+    assert cache.get(str(tmp_path / 'missing.css')) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['files'], stats['size']) == (1, 1, 1, 6)
+
+
+def test_file_cache_invalidation(tmp_path):
+    """
+    Проверяем сброс записи при изменении файла
+    :return:
+    """
+    path = tmp_path / 'app.js'
+    path.write_bytes(b'one')
+    cache = FileCache(1024)
+    entry = cache.get(str(path))
+    path.write_bytes(b'three')
+    os.utime(str(path), ns=(entry.stat.st_atime_ns, entry.stat.st_mtime_ns + 10 ** 9))
+    assert cache.get(str(path)).data == b'three'
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['size'] == 5
+
+
+def test_file_cache_eviction(tmp_path):
+    """
+    Проверяем вытеснение файлов по суммарному размеру и пропуск больших файлов
+    :return:
+    """
+    for name in ('a', 'b', 'c'):
+        (tmp_path / name).write_bytes(b'x' * 4)
+    (tmp_path / 'big').write_bytes(b'x' * 16)
+    cache = FileCache(10)
+    cache.get(str(tmp_path / 'a'))
+    cache.get(str(tmp_path / 'b'))
+    cache.get(str(tmp_path / 'a'))
+    cache.get(str(tmp_path / 'c'))
+    assert str(tmp_path / 'b') not in cache
+    assert str(tmp_path / 'a') in cache
+    assert cache.get(str(tmp_path / 'big')) is None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size'] == 8
@@ -0,0 +1,152 @@
+import os
+import time
+
+from ...src.muscles.wsgi.wsgi import BaseResponse, CachedResponse, Request, Cache, CacheBackend, FileCacheBackend
+
+
+def make_request(path, key='api.articles'):
+    request = Request(method='GET', protocol='HTTP/1.1', url='http://localhost%s' % path, headers={})
+    request.route = {'key': key}
+    return request
+
+
+def test_file_backend(tmp_path):
+    """
+    Проверяем файловое хранилище: время жизни, ограничение размера значения и вытеснение
+    :return:
+    """
+    backend = FileCacheBackend(directory=str(tmp_path), max_bytes=64, max_item_size=32)
+    assert backend.set('a', b'x' * 16, 30)
+    assert backend.get('a') == b'x' * 16
+    assert backend.get('b') is None
+
+    assert not backend.set('big', b'x' * 33, 30)
+    assert backend.stats()['rejected'] == 1
+
+    backend.set('short', b'y', 0.01)
+    time.sleep(0.02)
+    assert backend.get('short') is None
+
+    for name in ('c', 'd', 'e'):
+        time.sleep(0.01)
+        backend.set(name, b'z' * 16, 30)
+    assert backend.get('a') is None
+    assert backend.get('e') == b'z' * 16
+    assert backend.stats()['evictions'] >= 1
+
+    backend.clear()
+    assert backend.get('e') is None
+
+
+def test_shared_cache(tmp_path):
+    """
+    Проверяем кэш ответов с общим хранилищем: ответ доступен другому экземпляру кэша (воркеру),
+    invalidate маршрута действует на все экземпляры
+    :return:
+    """
+    first = Cache(ttl=30, backend=FileCacheBackend(directory=str(tmp_path)))
+    second = Cache(ttl=30, backend=FileCacheBackend(directory=str(tmp_path)))
+    key = first.key(make_request('/articles?page=1'))
+    response = first.fetch(key, lambda: BaseResponse(status=200, body='articles', headers=[('X-Id', '1')]))
+    assert response.content == b'articles'
+
+    cached = second.get(key)
+    assert cached is not None
+    assert cached.content == b'articles'
+    assert ('X-Id', '1') in cached.headers
+    assert cached.etag == response.etag
+
+    other = second.key(make_request('/users', key='api.users'))
+    second.fetch(other, lambda: BaseResponse(status=200, body='users'))
+    assert first.invalidate('api.articles') == 0
+    assert second.get(key) is None
+    assert first.get(other) is not None
+
+
+def test_file_backend_directory(tmp_path):
+    """
+    Проверяем, что директория хранилища создается с правами 0700, а доступная другим на запись не принимается
+    :return:
+    """
+    directory = tmp_path / 'cache'
+    FileCacheBackend(directory=str(directory))
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    try:
+        FileCacheBackend(directory=str(shared))
+        assert False
+    except Exception as e:
+        assert 'writable by other users' in str(e)
+
+
+def test_file_backend_eviction_scan(tmp_path):
+    """
+    Проверяем, что директория обходится только при превышении размера, а не при каждой записи
+    :return:
+    """
+    backend = FileCacheBackend(directory=str(tmp_path), max_bytes=1000)
+    scans = []
+    evict = backend._evict
+    backend._evict = lambda: scans.append(True) or evict()
+    for i in range(10):
+        backend.set('key%d' % i, b'x' * 10, 30)
+    assert len(scans) == 1
+    for i in range(100):
+        backend.set('more%d' % i, b'x' * 10, 30)
+    assert 1 < len(scans) < 20
+    assert backend.stats()['evictions'] > 0
+    assert sum(entry.stat().st_size for entry in os.scandir(str(tmp_path))) <= 1000
+
+
+def test_cached_response_format():
+    """
+    Проверяем сериализацию ответа для общего хранилища и отказ разбирать поврежденные данные
+    :return:
+    """
+    response = CachedResponse('200', [('X-Id', '1')], b'\x00body', reason='OK')
+    response.etag = '"v1"'
+    data = response.dumps()
+    loaded = CachedResponse.loads(data)
+    assert loaded.status == '200'
+    assert loaded.content == b'\x00body'
+    assert loaded.headers == [('X-Id', '1')]
+    assert loaded.etag == '"v1"'
+    for broken in (b'', data[:6], b'\x80' + data[1:]):
+        try:
+            CachedResponse.loads(broken)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_shared_cache_stats(tmp_path):
+    """
+    Проверяем, что чтение поколения маршрута не учитывается в промахах хранилища
+    :return:
+    """
+    cache = Cache(ttl=30, backend=FileCacheBackend(directory=str(tmp_path)))
+    key = cache.key(make_request('/articles'))
+    cache.fetch(key, lambda: BaseResponse(status=200, body='articles'))
+    cache.get(key)
+    stats = cache.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+
+
+def test_backend_interface():
+    """
+    Проверяем, что хранилище без реализации методов интерфейса не создается
+    :return:
+    """
+    class PartialBackend(CacheBackend):
+        def peek(self, key):
+            return None
+
+    try:
+        PartialBackend()
+        assert False
+    except TypeError as e:
+        assert 'abstract' in str(e)
@@ -0,0 +1,50 @@
+import datetime
+
+from ...src.muscles.wsgi.wsgi.codec import available_codecs, set_codec, get_codec
+
+
+def test_codecs_round_trip():
+    """
+    Проверяем, что все установленные кодеки сериализуют в байты и одинаково разбирают JSON
+    :return:
+    """
+    payload = {'id': 1, 'name': 'Имя', 'items': [1, 2.5, True, None], 'nested': {'a': 'b'}}
+    for name, codec_class in available_codecs.items():
+        if codec_class is None:
+            continue
+        codec = codec_class()
+        data = codec.dumps(payload)
+        assert isinstance(data, bytes), name
+        assert codec.loads(data) == payload, name
+        assert codec.loads(data.decode('utf-8')) == payload, name
+
+
+def test_codecs_default():
+    """
+    Проверяем сериализацию неизвестных объектов строкой, как у стандартного кодека
+    :return:
+    """
+    value = {'date': datetime.date(2020, 1, 2), 1: 'key', 'big': 2 ** 70}
+    for name, codec_class in available_codecs.items():
+        if codec_class is None:
+            continue
+        assert codec_class().loads(codec_class().dumps(value)) == {'date': '2020-01-02', '1': 'key', 'big': 2 ** 70}, name
+
+
+def test_set_codec():
+    """
+    Проверяем выбор кодека
+    :return:
+    """
+    current = get_codec()
+    assert current.name == 'json'
+    try:
+        assert set_codec('json').name == 'json'
+        assert get_codec().name == 'json'
+        try:
+            set_codec('unknown')
+            assert False
+        except Exception as e:
+            assert 'unknown' in str(e)
+    finally:
+        set_codec(current.name)
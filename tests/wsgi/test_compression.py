@@ -0,0 +1,65 @@
+import gzip
+import zlib
+
+from ...src.muscles.wsgi.wsgi.compression import Compression
+from ...src.muscles.wsgi.wsgi.streaming import ClosingIterator
+
+
+json_headers = [('Content-Type', 'application/json; charset=utf-8'), ('Content-Length', '4096'),
+                ('ETag', '"abc"')]
+
+
+def test_compress_body():
+    """
+    Проверяем сжатие тела ответа и заголовки
+    :return:
+    """
+    compression = Compression(min_size=100, encodings=('gzip',))
+    body = b'{"items": [' + b'1, ' * 2000 + b'1]}'
+    headers, compressed = compression.apply({'HTTP_ACCEPT_ENCODING': 'gzip, deflate'}, '200', json_headers, body)
+    headers = dict(headers)
+    assert gzip.decompress(compressed) == body
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Content-Length'] == str(len(compressed))
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert headers['ETag'] == 'W/"abc"'
+
+
+def test_compress_skip():
+    """
+    Проверяем пропуск сжатия: маленький ответ, неподходящий тип, уже сжатый ответ, клиент без поддержки
+    :return:
+    """
+    compression = Compression(min_size=100, encodings=('gzip',))
+    environ = {'HTTP_ACCEPT_ENCODING': 'gzip'}
+    headers, body = compression.apply(environ, '200', json_headers, b'{}')
+    assert body == b'{}'
+    assert 'Content-Encoding' not in dict(headers)
+    assert dict(headers)['Vary'] == 'Accept-Encoding'
+
+    image = [('Content-Type', 'image/jpeg')]
+    assert compression.apply(environ, '200', image, b'x' * 1000) == (image, b'x' * 1000)
+
+    encoded = [('Content-Type', 'text/css'), ('Content-Encoding', 'br')]
+    assert compression.apply(environ, '200', encoded, b'x' * 1000) == (encoded, b'x' * 1000)
+
+    headers, body = compression.apply({'HTTP_ACCEPT_ENCODING': 'gzip;q=0'}, '200', json_headers, b'x' * 1000)
+    assert body == b'x' * 1000
+
+
+def test_compress_stream():
+    """
+    Проверяем сжатие потокового ответа по частям и сохранение обработчиков закрытия
+    :return:
+    """
+    closed = []
+    compression = Compression(encodings=('gzip',))
+    source = ClosingIterator(iter([b'first,', b'second']), callbacks=[lambda: closed.append(True)])
+    headers, body = compression.apply_stream({'HTTP_ACCEPT_ENCODING': 'gzip'}, '200',
+                                             [('Content-Type', 'text/csv')], source)
+    assert 'Content-Length' not in dict(headers)
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(next(body)) == b'first,'
+    assert decompressor.decompress(b''.join(body)) + decompressor.flush() == b'second'
+    body.close()
+    assert closed == [True]
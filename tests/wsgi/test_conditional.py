@@ -0,0 +1,99 @@
+import json
+
+from ...src.muscles.wsgi.wsgi import BaseResponse, WsgiTransport, conditional
+from ...src.muscles.wsgi.wsgi.conditional import body_etag, version_etag
+from ...src.muscles.wsgi.wsgi.compression import Compression
+
+
+def make_transport(environ):
+    transport = WsgiTransport()
+    transport.environ = environ
+    transport.sent = []
+    transport.start_response = lambda status, headers: transport.sent.append((status, dict(headers)))
+    return transport
+
+
+def test_etags():
+    """
+    Проверяем формирование ETag по телу ответа и по токену версии
+    :return:
+    """
+    assert body_etag(b'{}') == body_etag(b'{}')
+    assert body_etag(b'{}') != body_etag(b'[]')
+    assert version_etag(None) is None
+    assert version_etag((1, '/api')) == version_etag((1, '/api'))
+    assert version_etag(1) != version_etag(2)
+
+
+def test_conditional_decorator():
+    """
+    Проверяем настройки обработчика
+    :return:
+    """
+    @conditional(version=lambda request: 1)
+    def handler(request):
+        return 'ok'
+
+    assert handler.auto_etag is True
+    assert handler.version(None) == 1
+
+
+def test_auto_etag_not_modified():
+    """
+    Проверяем ETag по телу ответа и ответ 304 при совпадении If-None-Match
+    :return:
+    """
+    response = BaseResponse(status=200, body={'id': 1})
+    response.auto_etag = True
+    transport = make_transport({'REQUEST_METHOD': 'GET'})
+    body = transport.make_response(response)
+    status, headers = transport.sent[-1]
+    assert json.loads(body[0]) == {'id': 1}
+    assert headers['ETag'] == body_etag(body[0])
+
+    response = BaseResponse(status=200, body={'id': 1})
+    response.auto_etag = True
+    transport = make_transport({'REQUEST_METHOD': 'GET', 'HTTP_IF_NONE_MATCH': headers['ETag']})
+    assert transport.make_response(response) == []
+    status, headers = transport.sent[-1]
+    assert status.startswith('304')
+    assert 'Content-Length' not in headers
+
+
+def test_version_etag_header():
+    """
+    Проверяем ETag, заданный токеном версии до формирования тела
+    :return:
+    """
+    response = BaseResponse(status=200, body='text')
+    response.etag = version_etag(3)
+    transport = make_transport({'REQUEST_METHOD': 'GET', 'HTTP_IF_NONE_MATCH': version_etag(2)})
+    assert transport.make_response(response) == [b'text']
+    assert transport.sent[-1][1]['ETag'] == version_etag(3)
+
+
+def test_compressed_not_modified():
+    """
+    Проверяем, что ответ 304 для сжимаемого ответа содержит тот же ETag и Vary, что и ответ 200
+    :return:
+    """
+    def make(environ):
+        response = BaseResponse(status=200, body={'items': list(range(500))})
+        response.auto_etag = True
+        transport = make_transport(dict(environ, REQUEST_METHOD='GET', HTTP_ACCEPT_ENCODING='gzip'))
+        transport.compression = Compression()
+        return transport, transport.make_response(response)
+
+    transport, body = make({})
+    status, headers = transport.sent[-1]
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['ETag'].startswith('W/')
+
+    transport, body = make({'HTTP_IF_NONE_MATCH': headers['ETag']})
+    assert body == []
+    status, not_modified = transport.sent[-1]
+    assert status.startswith('304')
+    assert not_modified['ETag'] == headers['ETag']
+    assert not_modified['Vary'] == headers['Vary'] == 'Accept-Encoding'
+    assert 'Content-Encoding' not in not_modified
+    assert 'Content-Length' not in not_modified
@@ -0,0 +1,101 @@
+import io
+import os
+
+from ...src.muscles.wsgi.wsgi import FileStorage
+
+
+def test_spool():
+    """
+    Проверяем хранение небольших файлов в памяти и перенос больших на диск
+    :return:
+    """
+    small = FileStorage('file', b'small', mime_type='text/plain', spool_size=1024)
+    assert not small.fp._rolled
+    assert small.value == b'small'
+
+    big = FileStorage('file', b'x' * 2048, mime_type='text/plain', spool_size=1024)
+    assert big.fp._rolled
+    assert big.value == b'x' * 2048
+
+
+def test_keep_value():
+    """
+    Проверяем, что без keep_value копия содержимого не хранится
+    :return:
+    """
+    storage = FileStorage('file', fp=io.BytesIO(b'content'), mime_type='text/plain', keep_value=False)
+    assert storage.value == b'content'
+    assert storage._value is None
+
+    storage = FileStorage('file', b'content', mime_type='text/plain', keep_value=False)
+    assert storage._value is None
+    assert storage.value == b'content'
+
+
+def test_save(tmp_path):
+    """
+    Проверяем сохранение из памяти, из временного файла и из открытого файла на диске
+    :return:
+    """
+    for size in (16, 4096):
+        storage = FileStorage('file', b'y' * size, filename='a.bin', mime_type='application/octet-stream',
+                              spool_size=1024)
+        path = str(tmp_path / ('saved_%d.bin' % size))
+        storage.save(path)
+        assert storage.filepath == path
+        assert storage.filename == 'saved_%d.bin' % size
+        assert storage.load() == b'y' * size
+        storage.fp.close()
+        with open(path, 'rb') as fp:
+            assert fp.read() == b'y' * size
+
+    source = tmp_path / 'source.bin'
+    source.write_bytes(b'source')
+    storage = FileStorage('file', fp=open(str(source), 'rb'), mime_type='application/octet-stream')
+    storage.fp.read(2)
+    target = str(tmp_path / 'target.bin')
+    storage.save(target)
+    storage.fp.close()
+    assert os.stat(target).st_ino != os.stat(str(source)).st_ino
+    with open(target, 'rb') as fp:
+        assert fp.read() == b'source'
+
+
+def test_empty_value(tmp_path):
+    """
+    Проверяем хранилище без содержимого
+    :return:
+    """
+    storage = FileStorage('file', filename='empty.txt', mime_type='text/plain')
+    assert storage.value == b''
+    assert storage.load() == b''
+    path = str(tmp_path / 'empty.txt')
+    storage.save(path)
+    storage.fp.close()
+    assert os.path.getsize(path) == 0
+
+
+def test_lazy_mime_type():
+    """
+    Проверяем, что MIME тип определяется только при обращении и по началу содержимого
+    :return:
+    """
+    from ...src.muscles.wsgi.wsgi import request as request_module
+    calls = []
+    sniff = request_module.sniff_mime_type
+
+    def counting(data):
+        calls.append(len(data))
+        return sniff(data)
+
+    request_module.sniff_mime_type = counting
+    try:
+        with open(os.path.join(os.path.dirname(__file__), '6152749397.jpg'), 'rb') as fp:
+            storage = FileStorage('file', fp.read() * 10)
+        assert calls == []
+        assert storage.mime_type == 'image/jpeg'
+        assert storage.mime_type == 'image/jpeg'
+        assert calls == [request_module.MIME_SNIFF_SIZE]
+    finally:
+        request_module.sniff_mime_type = sniff
+    assert request_module.sniff_mime_type(b'') is None
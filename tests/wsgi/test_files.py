@@ -0,0 +1,129 @@
+import io
+import os
+
+from ...src.muscles.wsgi.wsgi.files import FileIterator, MultipartRangeIterator, file_etag, http_date, \
+    is_not_modified, cache_control, parse_range, if_range_matches, accepted_encodings, negotiate_encoding
+
+
+image = os.path.join(os.path.dirname(__file__), '6152749397.jpg')
+
+
+def test_file_iterator_chunks():
+    """
+    Проверяем чтение файла блоками ограниченного размера
+    :return:
+    """
+    with open(image, 'rb') as fp:
+        content = fp.read()
+    iterator = FileIterator(open(image, 'rb'), os.stat(image).st_size, chunk_size=1024)
+    chunks = list(iterator)
+    iterator.close()
+    assert all(len(chunk) <= 1024 for chunk in chunks)
+    assert b''.join(chunks) == content
+    assert iterator.fp.closed
+
+
+def test_file_iterator_length():
+    """
+    Проверяем ограничение количества прочитанных байт
+    :return:
+    """
+    iterator = FileIterator(io.BytesIO(b'0123456789'), 4, chunk_size=3)
+    assert list(iterator) == [b'012', b'3']
+
+
+def test_not_modified_etag():
+    """
+    Проверяем условие If-None-Match
+    :return:
+    """
+    etag = file_etag(os.stat(image))
+    assert is_not_modified({'If-None-Match': etag}, etag=etag)
+    assert is_not_modified({'If-None-Match': '"other", W/%s' % etag}, etag=etag)
+    assert is_not_modified({'If-None-Match': '*'}, etag=etag)
+    assert not is_not_modified({'If-None-Match': '"other"'}, etag=etag)
+
+
+def test_not_modified_since():
+    """
+    Проверяем условие If-Modified-Since и его приоритет ниже If-None-Match
+    :return:
+    """
+    stat = os.stat(image)
+    etag = file_etag(stat)
+    assert is_not_modified({'If-Modified-Since': http_date(stat.st_mtime)}, etag=etag, mtime=stat.st_mtime)
+    assert not is_not_modified({'If-Modified-Since': http_date(stat.st_mtime - 60)}, etag=etag,
+                               mtime=stat.st_mtime)
+    assert not is_not_modified({'If-Modified-Since': 'invalid'}, etag=etag, mtime=stat.st_mtime)
+    assert not is_not_modified({'If-None-Match': '"other"', 'If-Modified-Since': http_date(stat.st_mtime)},
+                               etag=etag, mtime=stat.st_mtime)
+
+
+def test_cache_control():
+    """
+    Проверяем формирование политики кэширования
+    :return:
+    """
+    assert cache_control() is None
+    assert cache_control(max_age=3600) == 'public, max-age=3600'
+    assert cache_control(max_age=31536000, immutable=True) == 'public, max-age=31536000, immutable'
+
+
+def test_parse_range():
+    """
+    Проверяем разбор заголовка Range
+    :return:
+    """
+    assert parse_range(None, 10) is None
+    assert parse_range('bytes=0-4', 10) == [(0, 4)]
+    assert parse_range('bytes=-3', 10) == [(7, 9)]
+    assert parse_range('bytes=5-', 10) == [(5, 9)]
+    assert parse_range('bytes=0-100', 10) == [(0, 9)]
+    assert parse_range('bytes=0-1, 4-5', 10) == [(0, 1), (4, 5)]
+    assert parse_range('bytes=20-30', 10) == []
+    assert parse_range('bytes=10-', 10) == []
+    assert parse_range('bytes=99999-', 25600) == []
+    assert parse_range('bytes=3-1', 10) is None
+    assert parse_range('items=0-1', 10) is None
+
+
+def test_if_range():
+    """
+    Проверяем условие If-Range
+    :return:
+    """
+    stat = os.stat(image)
+    etag = file_etag(stat)
+    assert if_range_matches(None, etag=etag, mtime=stat.st_mtime)
+    assert if_range_matches(etag, etag=etag, mtime=stat.st_mtime)
+    assert not if_range_matches('W/' + etag, etag=etag, mtime=stat.st_mtime)
+    assert not if_range_matches('"other"', etag=etag, mtime=stat.st_mtime)
+    assert if_range_matches(http_date(stat.st_mtime), etag=etag, mtime=stat.st_mtime)
+    assert not if_range_matches(http_date(stat.st_mtime - 60), etag=etag, mtime=stat.st_mtime)
+
+
+def test_multipart_ranges():
+    """
+    Проверяем формирование ответа multipart/byteranges
+    :return:
+    """
+    iterator = MultipartRangeIterator(io.BytesIO(b'0123456789'), [(0, 1), (8, 9)], 10, 'text/plain', 'BOUNDARY')
+    body = b''.join(iterator)
+    assert body == b'--BOUNDARY\r\nContent-Type: text/plain\r\nContent-Range: bytes 0-1/10\r\n\r\n01\r\n' \
+                   b'--BOUNDARY\r\nContent-Type: text/plain\r\nContent-Range: bytes 8-9/10\r\n\r\n89\r\n' \
+                   b'--BOUNDARY--\r\n'
+    assert len(body) == iterator.content_length
+
+
+def test_negotiate_encoding():
+    """
+    Проверяем выбор заранее сжатого файла по заголовку Accept-Encoding
+    :return:
+    """
+    assert accepted_encodings('gzip, br;q=0.5, *;q=0') == {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+    assert negotiate_encoding('gzip, deflate, br', ['br', 'gzip']) == 'br'
+    assert negotiate_encoding('gzip, br;q=0.5', ['br', 'gzip']) == 'gzip'
+    assert negotiate_encoding('br;q=0, *', ['br', 'gzip']) == 'gzip'
+    assert negotiate_encoding('gzip', ['br']) is None
+    assert negotiate_encoding('identity', ['br', 'gzip']) is None
+    assert negotiate_encoding(None, ['br', 'gzip']) is None
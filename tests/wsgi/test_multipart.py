@@ -0,0 +1,72 @@
+import io
+
+from ...src.muscles.wsgi.wsgi.multipart import MultipartParser, parse_boundary
+from ...src.muscles.wsgi.wsgi.error_handler import ApplicationException
+
+BOUNDARY = 'XyZ0123boundary'
+
+
+def make_body(parts):
+    body = b''
+    for headers, value in parts:
+        body += b'--' + BOUNDARY.encode() + b'\r\n' + headers + b'\r\n\r\n' + value + b'\r\n'
+    return body + b'--' + BOUNDARY.encode() + b'--\r\n'
+
+
+BODY = make_body([
+    (b'Content-Disposition: form-data; name="foo"', b'bar'),
+    (b'Content-Disposition: form-data; name="image"; filename="a.jpg"\r\nContent-Type: image/jpeg',
+     b'\xff\xd8' + b'\r\n--Xy' * 3000 + b'\xff\xd9'),
+    (b'Content-Disposition: form-data; name="empty"', b''),
+])
+
+
+def test_parse_boundary():
+    """
+    Проверяем разбор границы из Content-Type
+    :return:
+    """
+    assert parse_boundary('multipart/form-data; boundary=%s' % BOUNDARY) == BOUNDARY
+    assert parse_boundary('multipart/form-data; boundary="%s"' % BOUNDARY) == BOUNDARY
+    assert parse_boundary('application/json') is None
+
+
+def test_parse_chunks():
+    """
+    Проверяем разбор полей и файлов при любом размере блока чтения, включая границы на стыке блоков
+    :return:
+    """
+    for chunk_size in (1, 7, 64, 65536):
+        parts = list(MultipartParser(io.BytesIO(BODY), BOUNDARY, content_length=len(BODY), chunk_size=chunk_size,
+                                     spool_size=1024))
+        assert [part.name for part in parts] == ['foo', 'image', 'empty']
+        assert parts[0].value == 'bar' and not parts[0].is_file
+        assert parts[1].filename == 'a.jpg'
+        assert parts[1].content_type == 'image/jpeg'
+        assert parts[1].file.read() == b'\xff\xd8' + b'\r\n--Xy' * 3000 + b'\xff\xd9'
+        assert parts[1].size == 2 + 6 * 3000 + 2
+        assert parts[2].value == ''
+
+
+def test_limits():
+    """
+    Проверяем ограничения количества частей, размера поля и тела, а также ошибку разбора
+    :return:
+    """
+    cases = [
+        dict(max_parts=2),
+        dict(max_field_size=2),
+        dict(max_size=100),
+    ]
+    for kwargs in cases:
+        try:
+            list(MultipartParser(io.BytesIO(BODY), BOUNDARY, content_length=len(BODY), **kwargs))
+            assert False
+        except ApplicationException as ex:
+            assert ex.status == 413
+
+    try:
+        list(MultipartParser(io.BytesIO(BODY[:200]), BOUNDARY))
+        assert False
+    except ApplicationException as ex:
+        assert ex.status == 400
@@ -329,3 +329,148 @@ def test_send_file():
     for pr in app:
         assert pr == b'{"dd": "1", "raw": "FileStorage(\'image/jpeg\', None)", "forms": null, ' \
                      b'"files": null, "request": {"url": "http://localhost:8080/api/v1/test_request/1/raw"}}'
+
+
+class CountingInput(io.BytesIO):
+    reads = 0
+
+    def read(self, *args):
+        self.reads += 1
+        return super().read(*args)
+
+
+def test_lazy_body():
+    """
+    Проверяем, что тело запроса разбирается при первом обращении и один раз
+    :return:
+    """
+    from ...src.muscles.wsgi.wsgi.request import RequestMaker
+    string = b'{"j": 1}'
+    stream = CountingInput(string)
+    request = RequestMaker(dict(environ, **{
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': stream,
+        'CONTENT_LENGTH': len(string),
+    })).make()
+    assert stream.reads == 0
+    assert not request.is_loaded
+    assert request.stream is stream
+    assert request.json == {'j': 1}
+    assert request.json == {'j': 1}
+    assert request.is_loaded
+    assert stream.reads == 1
+
+
+def test_lazy_body_error():
+    """
+    Проверяем, что ошибка разбора тела выбрасывается при обращении к телу, а не при создании запроса
+    :return:
+    """
+    from ...src.muscles.wsgi.wsgi.request import RequestMaker
+    from ...src.muscles.wsgi.wsgi.error_handler import ApplicationException
+    string = b'{"j": '
+    request = RequestMaker(dict(environ, **{
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': io.BytesIO(string),
+        'CONTENT_LENGTH': len(string),
+    })).make()
+    assert not request.is_exception
+    for i in range(2):
+        try:
+            request.json
+            assert False
+        except ApplicationException as ex:
+            assert ex.status == 400
+            assert ex.reason == 'JSON DECODE ERROR'
+    assert request.is_exception
+    try:
+        request.raw
+        assert False
+    except ApplicationException as ex:
+        assert ex.reason == 'JSON DECODE ERROR'
+
+    string = 'name=\u0431\u043e\u0431'.encode('cp1251')
+    request = RequestMaker(dict(environ, **{
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded; charset=utf-8',
+        'wsgi.input': io.BytesIO(string),
+        'CONTENT_LENGTH': len(string),
+    })).make()
+    for i in range(2):
+        try:
+            request.forms
+            assert False
+        except ApplicationException as ex:
+            assert ex.status == 400
+            assert ex.reason == 'FORM DECODE ERROR'
+
+
+def test_send_malformed_json():
+    """
+    Проверяем, что некорректное тело JSON приводит к ответу 400
+    :return:
+    """
+    statuses = []
+    string = b'{"j": '
+    app = muscular(dict(environ, **{
+        'REQUEST_METHOD': 'POST',
+        'REQUEST_URI': '/api/v1/test_request/1',
+        'PATH_INFO': '/api/v1/test_request/1',
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': io.BytesIO(string),
+        'CONTENT_LENGTH': len(string),
+    }), lambda status, headers: statuses.append(status))
+    list(app)
+    assert statuses[0].startswith('400')
+
+
+def test_before_request_malformed_json():
+    """
+    Проверяем, что ошибка разбора тела в глобальном before_request приводит к ответу 400
+    :return:
+    """
+    from ...src.muscles.wsgi.wsgi import Request
+
+    @Request.before_request()
+    def read_body(request):
+        if request.headers.get('X-Read-Body'):
+            request.json
+
+    statuses = []
+    string = b'{"j": '
+    app = muscular(dict(environ, **{
+        'REQUEST_METHOD': 'POST',
+        'REQUEST_URI': '/api/v1/test_request/1',
+        'PATH_INFO': '/api/v1/test_request/1',
+        'CONTENT_TYPE': 'application/json',
+        'HTTP_X_READ_BODY': '1',
+        'wsgi.input': io.BytesIO(string),
+        'CONTENT_LENGTH': len(string),
+    }), lambda status, headers: statuses.append(status))
+    list(app)
+    assert statuses[0].startswith('400')
+
+
+def test_memoized_properties():
+    """
+    Проверяем, что свойства запроса вычисляются один раз и сбрасываются при замене заголовков
+    :return:
+    """
+    from ...src.muscles.wsgi.wsgi import Request
+    request = Request(method='GET', protocol='HTTP/1.1', url='http://localhost/api/v1/test?a=1&b=2&b=3',
+                      headers={'Accept-Language': 'ru;q=0.9,en', 'Cookie': 'sid=1'})
+    assert request.query is request.query
+    assert request.m_query == {'a': '1', 'b': ['2', '3']}
+    assert request.accept_language == ['en', 'ru']
+    assert request.cookies == {'sid': '1'}
+    assert request.prefix == 'api'
+
+    request.headers = {'Accept-Language': 'de'}
+    assert request.accept_language == ['de']
+    assert request.cookies == {}
+
+    request.session = 'extra'
+    assert request.session == 'extra'
+    assert request.__dict__ == {'session': 'extra'}
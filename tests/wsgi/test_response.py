@@ -0,0 +1,34 @@
+from ...src.muscles.wsgi.wsgi import Response, MakeResponse
+
+
+class CountingResponse(Response):
+    calls = 0
+
+    def make_body(self):
+        self.calls += 1
+        return super().make_body()
+
+
+def test_body_serialized_once():
+    """
+    Проверяем, что тело ответа сериализуется один раз, а Content-Length считается по готовым байтам
+    :return:
+    """
+    response = MakeResponse(CountingResponse(200, {'id': 1, 'items': [1, 2, 3]}))
+    headers = dict(response.headers)
+    body = response.body
+    assert response.body is body
+    assert headers['Content-Length'] == str(len(body))
+    assert response.response.calls == 1
+
+
+def test_body_setter_resets_content():
+    """
+    Проверяем повторную сериализацию после замены тела ответа
+    :return:
+    """
+    response = CountingResponse(200, 'first')
+    assert response.content == b'first'
+    response.body = 'second'
+    assert response.content == b'second'
+    assert response.calls == 2
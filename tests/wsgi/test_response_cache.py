@@ -0,0 +1,133 @@
+import threading
+import time
+
+from ...src.muscles.wsgi.wsgi import BaseResponse, Request, Cache
+
+
+def make_request(path, headers=None, key='api.articles'):
+    request = Request(method='GET', protocol='HTTP/1.1', url='http://localhost%s' % path, headers=headers or {})
+    request.route = {'key': key}
+    return request
+
+
+def test_cache_fetch():
+    """
+    Проверяем сохранение ответа и ключ по параметрам запроса и заголовкам vary
+    :return:
+    """
+    cache = Cache(ttl=30, vary=['Accept-Language'])
+    calls = []
+
+    def build():
+        calls.append(True)
+        return BaseResponse(status=200, body='articles')
+
+    request = make_request('/articles?page=1', {'Accept-Language': 'ru'})
+    first = cache.fetch(cache.key(request), build)
+    second = cache.fetch(cache.key(request), build)
+    assert first is second
+    assert first.content == b'articles'
+    assert len(calls) == 1
+
+    cache.fetch(cache.key(make_request('/articles?page=2', {'Accept-Language': 'ru'})), build)
+    cache.fetch(cache.key(make_request('/articles?page=1', {'Accept-Language': 'en'})), build)
+    assert len(calls) == 3
+
+
+def test_cache_ttl_and_errors():
+    """
+    Проверяем истечение времени жизни и пропуск неуспешных ответов
+    :return:
+    """
+    cache = Cache(ttl=0.01)
+    key = cache.key(make_request('/articles'))
+    cache.fetch(key, lambda: BaseResponse(status=200, body='one'))
+    time.sleep(0.02)
+    assert cache.fetch(key, lambda: BaseResponse(status=200, body='two')).content == b'two'
+
+    key = cache.key(make_request('/broken'))
+    cache.fetch(key, lambda: BaseResponse(status=500, body='error'))
+    assert cache.get(key) is None
+
+
+def test_cache_singleflight():
+    """
+    Проверяем, что одновременные промахи выполняют обработчик один раз
+    :return:
+    """
+    cache = Cache(ttl=30)
+    key = cache.key(make_request('/slow'))
+    calls = []
+    results = []
+
+    def build():
+        calls.append(True)
+        time.sleep(0.05)
+        return BaseResponse(status=200, body='slow')
+
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch(key, build))) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert cache.stats()['coalesced'] >= 1
+
+
+def test_cache_wait_timeout():
+    """
+    Проверяем, что запрос не ждет зависший обработчик дольше wait_timeout и формирует ответ сам
+    :return:
+    """
+    cache = Cache(ttl=30, wait_timeout=0.05)
+    key = cache.key(make_request('/hang'))
+    release = threading.Event()
+    results = []
+
+    def hang():
+        release.wait(5)
+        return BaseResponse(status=200, body='late')
+
+    leader = threading.Thread(target=lambda: results.append(cache.fetch(key, hang)))
+    leader.start()
+    time.sleep(0.02)
+    started = time.monotonic()
+    response = cache.fetch(key, lambda: BaseResponse(status=200, body='own'))
+    assert time.monotonic() - started < 1
+    assert response.content == b'own'
+    release.set()
+    leader.join()
+    assert results[0].content == b'late'
+
+
+def test_cache_private_requests():
+    """
+    Проверяем, что запросы с Authorization или Cookie не используют кэш, если эти заголовки не входят в vary
+    :return:
+    """
+    cache = Cache(ttl=30)
+    assert cache.is_cacheable(make_request('/articles'))
+    assert not cache.is_cacheable(make_request('/articles', {'Authorization': 'Bearer alice'}))
+    assert not cache.is_cacheable(make_request('/articles', {'Cookie': 'sid=1'}))
+
+    cache = Cache(ttl=30, vary=['Cookie'])
+    alice = make_request('/articles', {'Cookie': 'sid=alice'})
+    bob = make_request('/articles', {'Cookie': 'sid=bob'})
+    assert cache.is_cacheable(alice)
+    assert not cache.is_cacheable(make_request('/articles', {'Cookie': 'sid=1', 'Authorization': 'Bearer a'}))
+    assert cache.key(alice) != cache.key(bob)
+
+
+def test_cache_invalidate():
+    """
+    Проверяем удаление ответов по ключу маршрута
+    :return:
+    """
+    cache = Cache(ttl=30)
+    cache.fetch(cache.key(make_request('/articles')), lambda: BaseResponse(status=200, body='a'))
+    cache.fetch(cache.key(make_request('/users', key='api.users')), lambda: BaseResponse(status=200, body='u'))
+    assert cache.invalidate('api.articles') == 1
+    assert cache.get(cache.key(make_request('/articles'))) is None
+    assert cache.get(cache.key(make_request('/users', key='api.users'))) is not None
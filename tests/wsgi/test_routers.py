@@ -0,0 +1,322 @@
+from ...src.muscles.wsgi.wsgi import Routes, Api, Request
+
+
+router = Routes(name='test_routers', prefix='/api')
+api_router = Api(name='test_routers', prefix='/v2')
+
+
+def make_request(path, method='GET', content_type='text/html'):
+    return Request(method=method, protocol='HTTP/1.1', url='http://localhost%s' % path,
+                   headers={'Content-Type': content_type})
+
+
+@router.init('/users/{name}', method='GET')
+def user_by_name(request, name=None):
+    return name
+
+
+@router.init('/users/me', method='GET')
+def user_me(request):
+    return 'me'
+
+
+@router.init('/users/{id:int}/posts', method='GET')
+def user_posts(request, id=None):
+    return id
+
+
+@router.init('/groups/admins/owners', method='GET')
+def group_owners(request):
+    return 'owners'
+
+
+@router.init('/groups/{group}/members', method='GET')
+def group_members(request, group=None):
+    return group
+
+
+@router.init('/files/{file}', method='GET')
+def file_by_name(request, file=None):
+    return file
+
+
+def test_match_static_first():
+    """
+    Проверяем, что статическая часть пути совпадает раньше части с правилом, как в дереве роутера
+    :return:
+    """
+    node, dictionary = router.match_with_params('/api/users/me')
+    assert node.key == 'api.users.me'
+    assert dictionary == {}
+
+    node, dictionary = router.match_with_params('/api/users/bob')
+    assert node.key == 'api.users.{name}'
+    assert dictionary == {'name': 'bob'}
+
+
+def test_match_empty_segments():
+    """
+    Проверяем, что пустые части пути (слэш в конце, двойной слэш) пропускаются
+    :return:
+    """
+    assert router.match('/api/users/bob/').key == 'api.users.{name}'
+    assert router.match('/api/users/me/').key == 'api.users.me'
+    assert router.match('/api//users/bob').key == 'api.users.{name}'
+    node, dictionary = router.match_with_params('/api//users/bob')
+    assert dictionary == {'name': 'bob'}
+    route, _ = router.get_current_route(make_request('/api/users/bob/'))
+    assert route['handler'].__name__ == 'user_by_name'
+    assert router.router_index().segment('//api/users/bob') == 'api'
+
+
+def test_match_typed_segments():
+    """
+    Проверяем работу правил частей пути
+    :return:
+    """
+    node, dictionary = router.match_with_params('/api/users/12/posts')
+    assert node.key == 'api.users.{id:int}.posts'
+    assert dictionary == {'id': '12'}
+
+    node, dictionary = router.match_with_params('/api/users/bob/posts')
+    assert node is None
+    assert dictionary == {}
+
+
+def test_match_backtracking():
+    """
+    Проверяем возврат к другой ветке дерева, если статическая ветка не подошла
+    :return:
+    """
+    node, dictionary = router.match_with_params('/api/groups/admins/members')
+    assert node.key == 'api.groups.{group}.members'
+    assert dictionary == {'group': 'admins'}
+
+    node, dictionary = router.match_with_params('/api/groups/admins/owners')
+    assert node.key == 'api.groups.admins.owners'
+    assert dictionary == {}
+
+
+def test_match_unquote():
+    """
+    Проверяем декодирование параметров пути
+    :return:
+    """
+    node, dictionary = router.match_with_params('/api/files/a%20b')
+    assert node.key == 'api.files.{file}'
+    assert dictionary == {'file': 'a b'}
+
+
+def test_match_not_found():
+    """
+    Проверяем отсутствие совпадений
+    :return:
+    """
+    assert router.match('/api/users/') is None
+    assert router.match('/api/unknown') is None
+    assert router.match('/users/me') is None
+
+
+def test_match_recompile_after_add():
+    """
+    Проверяем, что новый маршрут доступен после компиляции дерева
+    :return:
+    """
+    router.match('/api/users/me')
+
+    @router.init('/late/route', method='GET')
+    def late_route(request):
+        return 'late'
+
+    node = router.match('/api/late/route')
+    assert node is not None
+    assert node.key == 'api.late.route'
+
+
+@router.init('/orders', method='GET', content_type='application/json')
+def orders_json(request):
+    return 'json'
+
+
+@router.init('/orders', method='GET')
+def orders_any(request):
+    return 'any'
+
+
+@router.init('/orders', method='POST', content_type='*/*')
+def orders_create(request):
+    return 'create'
+
+
+def test_dispatch():
+    """
+    Проверяем выбор маршрута по методу и типу контента
+    :return:
+    """
+    node = router.match('/api/orders')
+    assert router.dispatch(node, 'get', 'application/json')['handler'].__name__ == 'orders_json'
+    assert router.dispatch(node, 'GET', 'text/html')['handler'].__name__ == 'orders_any'
+    assert router.dispatch(node, 'POST', 'text/html')['handler'].__name__ == 'orders_create'
+    assert router.dispatch(node, 'DELETE', 'text/html') is None
+
+
+def test_allowed_methods():
+    """
+    Проверяем список разрешенных методов маршрута
+    :return:
+    """
+    assert router.allowed_methods('/api/orders') == ['GET', 'POST']
+    assert router.allowed_methods('/api/unknown') is None
+
+
+@router.init('/members', key='members.list', method='GET')
+def members_list(request):
+    return 'list'
+
+
+@router.init('/members', key='members.create', method='POST')
+def members_create(request):
+    return 'create'
+
+
+def test_dispatch_keys_on_shared_path():
+    """
+    Проверяем маршруты с разными ключами на одном пути
+    :return:
+    """
+    route, _ = router.get_current_route(make_request('/api/members'))
+    assert route['handler'].__name__ == 'members_list'
+    route, _ = router.get_current_route(make_request('/api/members', method='POST'))
+    assert route['handler'].__name__ == 'members_create'
+    route, _ = router.get_current_route(make_request('/api/members', method='DELETE'))
+    assert route is None
+    assert router.allowed_methods('/api/members') == ['GET', 'POST']
+
+
+@api_router.init('/orders', method='GET')
+def api_orders(request):
+    return 'api'
+
+
+def test_resolve():
+    """
+    Проверяем поиск роутера по общему индексу
+    :return:
+    """
+    instance, call, dictionary = router.resolve(make_request('/v2/orders'))
+    assert instance is api_router
+    assert call['handler'].__name__ == 'api_orders'
+
+    instance, call, dictionary = api_router.resolve(make_request('/api/users/bob'))
+    assert instance is router
+    assert call['handler'].__name__ == 'user_by_name'
+    assert dictionary == {'name': 'bob'}
+
+    instance, call, dictionary = router.resolve(make_request('/v3/orders'))
+    assert instance is None
+    assert call is None
+
+
+def test_resolve_after_add():
+    """
+    Проверяем перестроение общего индекса после добавления маршрута
+    :return:
+    """
+    router.resolve(make_request('/v2/orders'))
+
+    @api_router.init('/late', method='GET')
+    def api_late(request):
+        return 'late'
+
+    instance, call, dictionary = router.resolve(make_request('/v2/late'))
+    assert instance is api_router
+    assert call['handler'].__name__ == 'api_late'
+
+
+def test_route_cache():
+    """
+    Проверяем кэш найденных маршрутов и его сброс при добавлении маршрута
+    :return:
+    """
+    cache = router.enable_route_cache(maxsize=16)
+    try:
+        call, dictionary = router.get_current_route(make_request('/api/users/bob'))
+        assert call['handler'].__name__ == 'user_by_name'
+        assert dictionary == {'name': 'bob'}
+        dictionary['name'] = 'changed'
+
+        call, dictionary = router.get_current_route(make_request('/api/users/bob'))
+        assert call['handler'].__name__ == 'user_by_name'
+        assert dictionary == {'name': 'bob'}
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+        @router.init('/cached/route', method='GET')
+        def cached_route(request):
+            return 'cached'
+
+        assert len(cache) == 0
+        call, dictionary = router.get_current_route(make_request('/api/cached/route'))
+        assert call['handler'].__name__ == 'cached_route'
+    finally:
+        router.disable_route_cache()
+
+
+def test_to_url():
+    """
+    Проверяем формирование ссылки по ключу маршрута
+    :return:
+    """
+    assert router.to_url('api.users.{id:int}.posts', {'id': 12}) == 'api/users/12/posts'
+    assert router.to_url('api.users.me', {}) == 'api/users/me'
+    assert router.to_url('api.unknown', {}) == ''
+    assert router.to_urls('api.users.{name}', [{'name': 'bob'}, {'name': 'alice'}]) == [
+        'api/users/bob',
+        'api/users/alice',
+    ]
+
+
+static_router = Routes(name='test_routers_static')
+static_router.add_static('static', prefix='/static/img')
+static_router.add_static('assets', prefix='/static')
+static_router.add_static('public', prefix='')
+static_router.add_static('media', prefix='/media')
+
+
+def test_static_nested_mounts():
+    """
+    Проверяем выбор директории для вложенных префиксов: подходит директория, добавленная первой
+    :return:
+    """
+    assert static_router.get_current_static(make_request('/static/img/a.png'))['prefix'] == '/static/img'
+    assert static_router.get_current_static(make_request('/STATIC/IMG/a.png'))['prefix'] == '/static/img'
+    assert static_router.get_current_static(make_request('/static/css/a.css'))['prefix'] == '/static'
+    assert static_router.get_current_static(make_request('/static/imgs/a.png'))['prefix'] == '/static'
+
+
+def test_static_default_mount():
+    """
+    Проверяем директорию без префикса: подходит для путей без своего префикса и перекрывает директории,
+    добавленные после нее
+    :return:
+    """
+    assert static_router.get_current_static(make_request('/favicon.ico'))['prefix'] == ''
+    assert static_router.get_current_static(make_request('/media/a.png'))['prefix'] == ''
+
+    root_router = Routes(name='test_routers_static_root')
+    root_router.add_static('public', prefix='')
+    root_router.add_static('assets', prefix='/static')
+    assert root_router.get_current_static(make_request('/static/a.css'))['prefix'] == ''
+
+
+def test_static_not_matching():
+    """
+    Проверяем пути, которым не подходит ни одна директория
+    :return:
+    """
+    prefixed_router = Routes(name='test_routers_static_prefixed')
+    prefixed_router.add_static('assets', prefix='/static')
+    assert prefixed_router.get_current_static(make_request('/static')) is None
+    assert prefixed_router.get_current_static(make_request('/statics/a.css')) is None
+    assert prefixed_router.get_current_static(make_request('/api/users')) is None
+    assert Routes(name='test_routers_static_empty').get_current_static(make_request('/static/a.css')) is None
@@ -0,0 +1,24 @@
+import json
+
+from ...src.muscles.wsgi.wsgi import WsgiServer, Request
+
+
+def test_before_response_changes_body():
+    """
+    Проверяем, что обработчики before_response могут изменить тело ответа до его сериализации
+    :return:
+    """
+    def handler(request):
+        return {'name': 'bob'}
+
+    def before_response(resp):
+        resp.body['hooked'] = True
+        return resp
+
+    request = Request(method='GET', protocol='HTTP/1.1', url='http://localhost/api/users',
+                      headers={'Content-Type': 'application/json'})
+    request.route = {'handler': handler}
+    server = WsgiServer('localhost', 8080, None)
+    resp = server.call_handler(request, {}, before_response=[before_response])
+    assert json.loads(resp.content) == {'name': 'bob', 'hooked': True}
+    assert ('Content-Length', str(len(resp.content))) in resp.headers
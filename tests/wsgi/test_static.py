@@ -0,0 +1,206 @@
+import io
+import os
+import tempfile
+
+from muscles.core import ResponseHandler
+
+from ...src.muscles.wsgi.wsgi import WsgiServer
+from ...src.muscles.wsgi.wsgi.routers import routes
+
+directory = tempfile.mkdtemp(prefix='muscles_static_')
+content = bytes(range(256)) * 100
+with open(os.path.join(directory, 'data.bin'), 'wb') as fp:
+    fp.write(content)
+routes.add_static(directory, prefix='/static_test', full_path=True, max_age=60)
+
+script = b'console.log("muscles");' * 100
+for name, data in (('app.js', script), ('app.js.gz', b'gzip sidecar'), ('app.js.br', b'brotli sidecar')):
+    with open(os.path.join(directory, name), 'wb') as fp:
+        fp.write(data)
+routes.add_static(directory, prefix='/static_compressed', full_path=True, precompressed=True)
+routes.add_static(directory, prefix='/static_cached', full_path=True, file_cache=1024 * 1024)
+
+
+class FileWrapper:
+    """
+    wsgi.file_wrapper uWSGI: запоминает переданные файлы
+    """
+
+    files = []
+
+    def __init__(self, fp, block_size):
+        self.fp = fp
+        self.block_size = block_size
+        self.files.append(self)
+
+    def __iter__(self):
+        while True:
+            data = self.fp.read(self.block_size)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        self.fp.close()
+
+
+def get(path, headers=None, method='GET', file_wrapper=None):
+    """
+    Выполняет запрос через WsgiServer
+
+    :return: (статус, заголовки, тело)
+    """
+    environ = {
+        'REQUEST_METHOD': method,
+        'REQUEST_URI': path,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '8080',
+        'UWSGI_ROUTER': 'http',
+        'REMOTE_ADDR': '127.0.0.1',
+        'REMOTE_PORT': '34030',
+        'HTTP_HOST': 'localhost:8080',
+        'wsgi.input': io.BytesIO(),
+    }
+    if file_wrapper is not None:
+        environ['wsgi.file_wrapper'] = file_wrapper
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    sent = []
+    server = WsgiServer('localhost', 8080, ResponseHandler)
+    body = server.execute(environ=environ, start_response=lambda status, headers: sent.append((status, headers)))
+    try:
+        data = b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    status, headers = sent[-1]
+    return status, dict(headers), data
+
+
+def test_static_file_wrapper():
+    """
+    Проверяем отдачу статического файла через wsgi.file_wrapper и без него
+    :return:
+    """
+    FileWrapper.files.clear()
+    status, headers, data = get('/static_test/data.bin', file_wrapper=FileWrapper)
+    assert status.startswith('200')
+    assert data == content
+    assert headers['Content-Length'] == str(len(content))
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert len(FileWrapper.files) == 1
+    assert FileWrapper.files[0].fp.name == os.path.join(directory, 'data.bin')
+
+    status, headers, data = get('/static_test/data.bin')
+    assert status.startswith('200')
+    assert data == content
+
+    status, headers, data = get('/static_test/data.bin', method='HEAD', file_wrapper=FileWrapper)
+    assert headers['Content-Length'] == str(len(content))
+    assert data == b''
+
+
+def test_static_not_modified():
+    """
+    Проверяем ответ 304 по If-None-Match и If-Modified-Since
+    :return:
+    """
+    status, headers, data = get('/static_test/data.bin')
+    assert status.startswith('200')
+    assert headers['Cache-Control'] == 'public, max-age=60'
+    etag = headers['ETag']
+    last_modified = headers['Last-Modified']
+
+    status, not_modified, data = get('/static_test/data.bin', headers={'If-None-Match': etag})
+    assert status.startswith('304')
+    assert data == b''
+    assert not_modified['ETag'] == etag
+    assert 'Content-Length' not in not_modified
+
+    status, not_modified, data = get('/static_test/data.bin', headers={'If-Modified-Since': last_modified})
+    assert status.startswith('304')
+    assert data == b''
+
+    status, headers, data = get('/static_test/data.bin', headers={'If-None-Match': '"other"'})
+    assert status.startswith('200')
+    assert data == content
+
+
+def test_static_range():
+    """
+    Проверяем ответы 206, 416 и multipart/byteranges на запросы с Range
+    :return:
+    """
+    size = len(content)
+    status, headers, data = get('/static_test/data.bin', headers={'Range': 'bytes=10-19'})
+    assert status.startswith('206')
+    assert data == content[10:20]
+    assert headers['Content-Range'] == 'bytes 10-19/%d' % size
+    assert headers['Content-Length'] == '10'
+
+    status, headers, data = get('/static_test/data.bin', headers={'Range': 'bytes=%d-' % size})
+    assert status.startswith('416')
+    assert headers['Content-Range'] == 'bytes */%d' % size
+
+    status, headers, data = get('/static_test/data.bin', headers={'Range': 'bytes=0-4, -5'})
+    assert status.startswith('206')
+    content_type, boundary = headers['Content-Type'].split('; boundary=')
+    assert content_type == 'multipart/byteranges'
+    assert headers['Content-Length'] == str(len(data))
+    parts = data.split(b'--' + boundary.encode('latin-1'))
+    assert parts[-1] == b'--\r\n'
+    assert b'Content-Range: bytes 0-4/%d\r\n\r\n' % size + content[:5] + b'\r\n' in parts[1]
+    assert b'Content-Range: bytes %d-%d/%d\r\n\r\n' % (size - 5, size - 1, size) + content[-5:] + b'\r\n' \
+        in parts[2]
+
+
+def test_static_precompressed():
+    """
+    Проверяем отдачу заранее сжатых файлов .br и .gz по заголовку Accept-Encoding
+    :return:
+    """
+    status, headers, data = get('/static_compressed/app.js', headers={'Accept-Encoding': 'gzip, br'})
+    assert status.startswith('200')
+    assert data == b'brotli sidecar'
+    assert headers['Content-Encoding'] == 'br'
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert headers['Content-Type'].startswith('text/javascript') or \
+        headers['Content-Type'].startswith('application/javascript')
+
+    status, headers, data = get('/static_compressed/app.js', headers={'Accept-Encoding': 'gzip'})
+    assert data == b'gzip sidecar'
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Vary'] == 'Accept-Encoding'
+
+    status, headers, data = get('/static_compressed/app.js')
+    assert data == script
+    assert 'Content-Encoding' not in headers
+    assert headers['Vary'] == 'Accept-Encoding'
+
+
+def test_static_file_cache():
+    """
+    Проверяем, что повторный запрос файла отдаётся из кэша в памяти
+    :return:
+    """
+    FileWrapper.files.clear()
+    status, headers, data = get('/static_cached/data.bin', file_wrapper=FileWrapper)
+    assert status.startswith('200')
+    assert data == content
+    stats = routes.static_stats()['/static_cached']
+    hits = stats['hits']
+
+    status, headers, data = get('/static_cached/data.bin', file_wrapper=FileWrapper)
+    assert status.startswith('200')
+    assert data == content
+    assert headers['Content-Length'] == str(len(content))
+    assert routes.static_stats()['/static_cached']['hits'] == hits + 1
+    assert FileWrapper.files == []
+
+    status, headers, data = get('/static_cached/data.bin', headers={'Range': 'bytes=100-199'})
+    assert status.startswith('206')
+    assert data == content[100:200]
+    assert routes.static_stats()['/static_cached']['hits'] == hits + 2
@@ -0,0 +1,183 @@
+import json
+import queue
+
+from muscles import Model, Column, Key, String
+from muscles.core import Collection
+
+from ...src.muscles.wsgi.wsgi import StreamingResponse, JsonStreamResponse, EventSourceResponse, MakeResponse
+from ...src.muscles.wsgi.wsgi.streaming import ClosingIterator, is_stream, iter_ndjson, iter_json_array, \
+    ServerSentEvent, iter_events, iter_queue, STOP_EVENTS
+
+
+def test_is_stream():
+    """
+    Проверяем определение потокового результата обработчика
+    :return:
+    """
+    assert is_stream(chunk for chunk in ('a', 'b'))
+    assert is_stream(iter([b'a']))
+    assert not is_stream([b'a'])
+    assert not is_stream('text')
+    assert not is_stream({'a': 1})
+
+
+def test_closing_iterator():
+    """
+    Проверяем кодирование частей и вызов всех обработчиков закрытия
+    :return:
+    """
+    closed = []
+
+    def rows():
+        try:
+            yield 'id,name\n'
+            yield b'1,bob\n'
+        finally:
+            closed.append('generator')
+
+    def failing():
+        closed.append('failing')
+        raise Exception('close error')
+
+    iterator = ClosingIterator(rows(), callbacks=[failing, lambda: closed.append('cursor')])
+    assert next(iterator) == b'id,name\n'
+    try:
+        iterator.close()
+        assert False
+    except Exception as e:
+        assert str(e) == 'close error'
+    assert closed == ['generator', 'failing', 'cursor']
+    iterator.close()
+    assert closed == ['generator', 'failing', 'cursor']
+
+
+def test_streaming_response():
+    """
+    Проверяем заголовки потокового ответа без Content-Length
+    :return:
+    """
+    closed = []
+    response = StreamingResponse((str(i) for i in range(3)), content_type='text/csv',
+                                 headers=[('Content-Length', '10'), ('X-Export', '1')])
+    response.on_close(lambda: closed.append(True))
+    made = MakeResponse(response)
+    headers = dict(made.headers)
+    assert made.is_stream
+    assert 'Content-Length' not in headers
+    assert headers['Content-Type'] == 'text/csv'
+    assert headers['X-Export'] == '1'
+    body = made.body
+    assert list(body) == [b'0', b'1', b'2']
+    body.close()
+    assert closed == [True]
+
+
+def test_json_stream_encoders():
+    """
+    Проверяем потоковую сериализацию в NDJSON и JSON массив
+    :return:
+    """
+    items = [{'id': i} for i in range(5)]
+    lines = b''.join(iter_ndjson(iter(items))).splitlines()
+    assert [json.loads(line) for line in lines] == items
+    assert json.loads(b''.join(iter_json_array(iter(items)))) == items
+    assert json.loads(b''.join(iter_json_array(iter([])))) == []
+    assert json.loads(b''.join(iter_json_array(iter(items), envelope={'status': 'SUCCESS'}))) == {
+        'status': 'SUCCESS', 'data': items}
+    assert json.loads(b''.join(iter_json_array(iter(items), envelope={}, key='rows'))) == {'rows': items}
+
+
+def test_json_stream_first_chunk():
+    """
+    Проверяем, что первая часть ответа отдается до чтения всей коллекции
+    :return:
+    """
+    produced = []
+
+    def rows():
+        for i in range(10000):
+            produced.append(i)
+            yield {'id': i, 'name': 'user %s' % i}
+
+    chunks = iter_json_array(rows(), chunk_size=1024)
+    first = next(chunks)
+    assert first.startswith(b'[')
+    assert len(produced) < 100
+
+
+def test_json_stream_response():
+    """
+    Проверяем заголовки потокового JSON ответа
+    :return:
+    """
+    response = MakeResponse(JsonStreamResponse(iter([{'id': 1}]), ndjson=True))
+    assert dict(response.headers)['Content-Type'] == 'application/x-ndjson'
+    body = b''.join(response.body)
+    assert body.endswith(b'\n')
+    assert json.loads(body) == {'id': 1}
+
+
+class StreamUser(Model):
+    id = Column(Key)
+    name = Column(String)
+
+
+def test_json_stream_collection():
+    """
+    Проверяем потоковую сериализацию моделей коллекции
+    :return:
+    """
+    users = Collection('users', StreamUser(id=1, name='bob'), StreamUser(id=2, name='alice'))
+    expected = [{'id': '1', 'name': 'bob'}, {'id': '2', 'name': 'alice'}]
+    assert [json.loads(line) for line in b''.join(iter_ndjson(users)).splitlines()] == expected
+    assert json.loads(b''.join(iter_json_array(users, envelope={'status': 'SUCCESS'}))) == \
+        {'status': 'SUCCESS', 'data': expected}
+    response = MakeResponse(JsonStreamResponse(users))
+    assert json.loads(b''.join(response.body)) == expected
+
+
+def test_server_sent_event():
+    """
+    Проверяем формат событий Server-Sent Events
+    :return:
+    """
+    assert ServerSentEvent('hello').encode() == b'data: hello\n\n'
+    assert ServerSentEvent('a\nb', event='update', id=7).encode() == b'event: update\nid: 7\ndata: a\ndata: b\n\n'
+    assert ServerSentEvent(retry=3000).encode() == b'retry: 3000\n\n'
+    assert ServerSentEvent(event='x\ny').encode() == b'event: xy\n\n'
+    assert json.loads(ServerSentEvent({'id': 1}).encode()[len(b'data: '):]) == {'id': 1}
+
+
+def test_event_queue_heartbeat():
+    """
+    Проверяем комментарии при отсутствии событий и окончание очереди
+    :return:
+    """
+    events = queue.Queue()
+    events.put('first')
+    stream = iter_events(iter_queue(events, heartbeat=0.01), retry=1000)
+    assert next(stream) == b'retry: 1000\n\n'
+    assert next(stream) == b'data: first\n\n'
+    assert next(stream) == b':\n\n'
+    events.put(ServerSentEvent('second', id=2))
+    events.put(STOP_EVENTS)
+    assert list(stream) == [b'id: 2\ndata: second\n\n']
+
+
+def test_event_source_response():
+    """
+    Проверяем заголовки ответа и вызов обработчиков при отключении клиента
+    :return:
+    """
+    closed = []
+    events = queue.Queue()
+    events.put('ping')
+    response = MakeResponse(EventSourceResponse(events, on_close=lambda: closed.append(True)))
+    headers = dict(response.headers)
+    assert headers['Content-Type'] == 'text/event-stream; charset=utf-8'
+    assert headers['Cache-Control'] == 'no-cache'
+    assert 'Content-Length' not in headers
+    body = response.body
+    assert next(body) == b'data: ping\n\n'
+    body.close()
+    assert closed == [True]